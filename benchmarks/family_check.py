@@ -0,0 +1,72 @@
+"""Check that the family of horses is read from live Horse Reality pages.
+
+The pedigree and offspring selectors are only exercised by the synthetic
+pages in corpus/ otherwise. For every horse given with --horse, this prints
+its sire, dam, pedigree and offspring as read by both parsers, and exits
+with an error if a page has no pedigree entries at all (every horse page has
+a pedigree, with unknown ancestors left blank) or if the parsers disagree.
+
+With --save, the pages are also written to corpus/ as live_N.html, so that
+run.py --compare-parsers keeps checking them offline. Remove anything
+private from them (e.g. the CSRF token and your account's name) before
+committing them.
+
+Usage: python benchmarks/family_check.py --cookie NAME=VALUE --horse N [--horse N ...] [--save]
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import horsereality  # noqa: E402
+from horsereality.parsing import PARSERS, parse_horse_page  # noqa: E402
+from horsereality.utils import atomic_write  # noqa: E402
+from server import CORPUS_DIR  # noqa: E402
+
+FAMILY = ('sire_lifenumber', 'dam_lifenumber', 'pedigree', 'offspring')
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cookie', required=True)
+    parser.add_argument('--horse', type=int, action='append', required=True)
+    parser.add_argument('--save', action='store_true')
+    args = parser.parse_args()
+
+    name, _, value = args.cookie.partition('=')
+    client = horsereality.Client(name, value)
+    await client.verify()
+
+    failures = 0
+    try:
+        for lifenumber in args.horse:
+            html_text = await client.http.get_horse(lifenumber)
+            if args.save:
+                with atomic_write(os.path.join(CORPUS_DIR, f'live_{lifenumber}.html')) as fp:
+                    fp.write(html_text)
+            families = []
+            for engine in PARSERS:
+                data = parse_horse_page(html_text, parser=engine)
+                families.append({key: data[key] for key in FAMILY})
+
+            family = families[0]
+            print(f'{lifenumber}: sire {family["sire_lifenumber"]}, dam {family["dam_lifenumber"]}, '
+                  f'{len(family["pedigree"])} in pedigree, {len(family["offspring"])} offspring')
+            if not family['pedigree']:
+                failures += 1
+                print(f'{lifenumber}: no pedigree entries were found on the page')
+            if any(other != family for other in families[1:]):
+                failures += 1
+                print(f'{lifenumber}: the parsers disagree: {families!r}')
+    finally:
+        await client.close()
+
+    print(f'{len(args.horse)} horses checked, {failures} failed')
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
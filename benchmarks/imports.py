@@ -0,0 +1,89 @@
+"""Import-time benchmark, to catch imports that make startup slower.
+
+Each scenario is timed in a fresh interpreter, and the heavy dependencies
+that it ended up importing are listed. With --max-ms, this exits with an
+error if the bare ``import horsereality`` takes longer than that, or if it
+imports any heavy dependency.
+
+Usage: python benchmarks/imports.py [--runs 7] [--max-ms N]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+HEAVY = ('aiohttp', 'bs4', 'numpy', 'PIL', 'pyarrow')
+
+SCENARIOS = (
+    ('import horsereality', 'import horsereality'),
+    ('utils', 'from horsereality.utils import get_lifenumber_from_url'),
+    ('enums', 'from horsereality import Breed'),
+    ('models', 'from horsereality import Horse'),
+    ('client', 'from horsereality import Client'),
+)
+
+# Runs a scenario and reports how long it took and what it imported
+TIMER = '''
+import json, sys, time
+start = time.perf_counter()
+exec(sys.argv[1])
+elapsed = time.perf_counter() - start
+print(json.dumps([elapsed, [name for name in sys.argv[2:] if name in sys.modules]]))
+'''
+
+
+def run(statement: str):
+    output = subprocess.check_output(
+        [sys.executable, '-c', TIMER, statement, *HEAVY],
+        cwd=ROOT,
+        env={**os.environ, 'PYTHONPATH': ROOT},
+    )
+    elapsed, loaded = json.loads(output)
+    return elapsed * 1000, loaded
+
+
+def check_exports() -> None:
+    # The lazy exports in __init__ are listed by hand, so make sure that
+    # they still match what the submodules export
+    sys.path.insert(0, ROOT)
+    import importlib
+    import horsereality
+
+    for module, names in horsereality._modules.items():
+        actual = importlib.import_module(f'horsereality.{module}').__all__
+        if tuple(names) != tuple(actual):
+            sys.exit(f'horsereality/__init__.py exports {names!r} from {module}, but its __all__ is {actual!r}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=7)
+    parser.add_argument('--max-ms', type=float, default=None)
+    args = parser.parse_args()
+
+    check_exports()
+
+    print(f'Import time (median of {args.runs} runs)')
+    results = {}
+    for name, statement in SCENARIOS:
+        timings = []
+        for _ in range(args.runs):
+            elapsed, loaded = run(statement)
+            timings.append(elapsed)
+        results[name] = (statistics.median(timings), loaded)
+        print(f'  {name:<20} {results[name][0]:8.1f} ms  loads: {", ".join(loaded) or "-"}')
+
+    if args.max_ms is not None:
+        elapsed, loaded = results['import horsereality']
+        if elapsed > args.max_ms:
+            sys.exit(f'import horsereality took {elapsed:.1f} ms, more than {args.max_ms:.1f} ms')
+        if loaded:
+            sys.exit(f'import horsereality imported {", ".join(loaded)}')
+
+
+if __name__ == '__main__':
+    main()
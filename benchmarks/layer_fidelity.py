@@ -0,0 +1,186 @@
+"""Fidelity check for layer images that are resized locally (see the
+derive_layer_sizes client option) against the ones that Horse Reality
+serves.
+
+For every layer, the small and medium images are derived from the large one
+at the dimensions of the served images, like a client does, and compared
+with them. The peak signal-to-noise ratio of the colour (weighted by alpha)
+and of the alpha channel is reported, and with --min-psnr, this exits with
+an error if any layer is below it. A client takes the dimensions of each
+size from the first image of that size that is served, so this also exits
+with an error if served images of the same size have different dimensions
+while their large images do not.
+
+By default, layers are read from the fixtures in benchmarks/layers, which
+has a directory with large.png, medium.png and small.png for each layer, so
+this runs offline. Add served layers to it with --save. Fixtures whose name
+starts with "synthetic" were not captured from Horse Reality: the committed
+benchmarks/layers/synthetic was made with Pillow's box filter, so it only
+checks the resizer against itself. This exits with an error if no served
+layers were compared. Layers can also be read from a LayerStore directory
+that already has all three sizes of them (--store), or downloaded for the
+horses given with --horse, which needs an account's remember cookie
+(--cookie NAME=VALUE).
+
+Usage: python benchmarks/layer_fidelity.py [--fixtures DIR] [--min-psnr 35]
+       python benchmarks/layer_fidelity.py --store DIR
+       python benchmarks/layer_fidelity.py --cookie NAME=VALUE --horse N [--horse N ...] [--save DIR]
+"""
+import argparse
+import asyncio
+import io
+import math
+import os
+import sys
+
+import numpy
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import horsereality  # noqa: E402
+from horsereality.render import DERIVED_LAYER_SIZES, layer_dimensions, resize_layer  # noqa: E402
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'layers')
+
+
+def psnr(a, b) -> float:
+    error = numpy.mean((a - b) ** 2)
+    return math.inf if error == 0 else 10 * math.log10(255 ** 2 / error)
+
+
+def compare(derived: bytes, served: bytes):
+    # (colour PSNR, alpha PSNR)
+    derived = numpy.asarray(Image.open(io.BytesIO(derived)).convert('RGBA'), dtype=numpy.float64)
+    served = numpy.asarray(Image.open(io.BytesIO(served)).convert('RGBA'), dtype=numpy.float64)
+
+    # Colours under transparent pixels do not show, so they are compared
+    # premultiplied
+    colour = psnr(derived[..., :3] * derived[..., 3:] / 255, served[..., :3] * served[..., 3:] / 255)
+    return colour, psnr(derived[..., 3], served[..., 3])
+
+
+def from_fixtures(directory: str):
+    for name in sorted(os.listdir(directory)):
+        fixture = os.path.join(directory, name)
+        if not os.path.isdir(fixture):
+            continue
+        images = {}
+        for size in ('large', *DERIVED_LAYER_SIZES):
+            filename = os.path.join(fixture, f'{size}.png')
+            if not os.path.exists(filename):
+                raise SystemExit(f'{filename} is missing')
+            with open(filename, 'rb') as fp:
+                images[size] = fp.read()
+        large = images.pop('large')
+        yield name, large, images
+
+
+def save_fixture(directory: str, path: str, large: bytes, served) -> None:
+    # Named after the layer's ID and body part, e.g. 1a2b..-body
+    parts = path.strip('/').split('/')
+    fixture = os.path.join(directory, f'{parts[-1][:-len(".png")]}-{parts[3]}')
+    os.makedirs(fixture, exist_ok=True)
+    for size, data in (('large', large), *served.items()):
+        with open(os.path.join(fixture, f'{size}.png'), 'wb') as fp:
+            fp.write(data)
+
+
+def from_store(directory: str):
+    store = horsereality.LayerStore(directory, max_bytes=2 ** 62)
+    paths = sorted(
+        '/' + os.path.relpath(os.path.join(root, filename), store.directory).replace(os.sep, '/')
+        for root, _, filenames in os.walk(store.directory)
+        for filename in filenames
+    )
+    for path in paths:
+        if path not in store or path.split('/')[5] != 'large':
+            continue
+        sizes = {size: path.replace('/large/', f'/{size}/') for size in DERIVED_LAYER_SIZES}
+        if all(size_path in store for size_path in sizes.values()):
+            yield path, bytes(store.get(path)), {size: bytes(store.get(size_path)) for size, size_path in sizes.items()}
+
+
+async def from_horses(cookie: str, lifenumbers):
+    name, _, value = cookie.partition('=')
+    client = horsereality.Client(name, value)
+    await client.verify()
+    try:
+        async for lifenumber, horse in client.get_horses(lifenumbers):
+            if isinstance(horse, Exception):
+                print(f'{lifenumber}: {horse}')
+                continue
+            for layer in horse.layers:
+                served = {size: await layer.read(size) for size in DERIVED_LAYER_SIZES}
+                yield layer.url_path_with_size('large'), await layer.read('large'), served
+    finally:
+        await client.close()
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--fixtures', default=FIXTURES_DIR)
+    parser.add_argument('--store')
+    parser.add_argument('--cookie')
+    parser.add_argument('--horse', type=int, action='append', default=[])
+    parser.add_argument('--save')
+    parser.add_argument('--min-psnr', type=float, default=None)
+    args = parser.parse_args()
+
+    async def iterate(layers):
+        for layer in layers:
+            yield layer
+
+    if args.store:
+        source = iterate(from_store(args.store))
+    elif args.cookie or args.horse:
+        if not (args.cookie and args.horse):
+            parser.error('--cookie and --horse are required together')
+        source = from_horses(args.cookie, args.horse)
+    else:
+        source = iterate(from_fixtures(args.fixtures))
+
+    # The served dimensions of each size, by (size, large dimensions)
+    dimensions = {}
+    failures = inconsistent = count = served_count = 0
+    async for path, large, served in source:
+        if args.save:
+            save_fixture(args.save, path, large, served)
+        synthetic = os.path.basename(path).startswith('synthetic')
+        for size, served_image in served.items():
+            count += 1
+            served_count += not synthetic
+            served_size = layer_dimensions(served_image)
+            key = (size, layer_dimensions(large))
+            if dimensions.setdefault(key, served_size) != served_size:
+                failures += 1
+                inconsistent += 1
+                print(
+                    f'{path} {size}: DIMENSIONS DIFFER from other {size} images of '
+                    f'{key[1][0]}x{key[1][1]} large images: {served_size[0]}x{served_size[1]}, '
+                    f'not {dimensions[key][0]}x{dimensions[key][1]}'
+                )
+
+            colour, alpha = compare(resize_layer(large, served_size), served_image)
+            worst = min(colour, alpha)
+            if args.min_psnr is not None and worst < args.min_psnr:
+                failures += 1
+            print(f'{path} {size}: {served_size[0]}x{served_size[1]}  colour {colour:6.2f} dB  alpha {alpha:6.2f} dB')
+
+    print(f'{count} images compared ({served_count} served by Horse Reality), {failures} failed')
+    if inconsistent:
+        print(
+            f'{inconsistent} images are not the size of others like them, '
+            'so derive_layer_sizes would resize some layers to the wrong dimensions'
+        )
+    if not served_count:
+        print(
+            'None of the images were served by Horse Reality. Add some with '
+            '--cookie NAME=VALUE --horse N --save benchmarks/layers before relying on derive_layer_sizes'
+        )
+    if failures or not served_count:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
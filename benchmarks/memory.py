@@ -0,0 +1,63 @@
+"""Measures how much memory Horse and Layer objects take up.
+
+Usage: python benchmarks/memory.py [count]
+"""
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from horsereality import Horse, Layer  # noqa: E402
+
+
+def horse_data(lifenumber: int):
+    return {
+        'lifenumber': lifenumber,
+        'name': f'Horse {lifenumber}',
+        'sex': 'mare',
+        'breed': 'Arabian Horse',
+        'age': '3 years 2 months',
+        'birthdate': '09-12-2021',
+        'horse_height': '15.1 hh',
+        'location': 'Europe',
+        'owner': 'shay',
+        'registry': None,
+        'predicates': None,
+        'layers': {
+            'adult': [
+                # Built from new strings every time, like a parsed page
+                ''.join(['/upload/colours/mares/', part, '/large/', layer_id, '.png'])
+                for part, layer_id in (('body', 'a1b2c3'), ('mane', 'd4e5f6'), ('tail', 'a7b8c9'), ('body', 'ffee01'))
+            ],
+            'foal': [],
+        },
+    }
+
+
+def measure(build, count: int) -> float:
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    objects = [build(index) for index in range(count)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    size = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    del objects
+    return size / count
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    datas = [horse_data(7000000 + index) for index in range(count)]
+    urls = [url for data in datas for url in data['layers']['adult']]
+
+    layer_bytes = measure(lambda index: Layer(http=None, url=urls[index]), len(urls))
+    horse_bytes = measure(lambda index: Horse._from_data(None, datas[index]), count)
+
+    print(f'Layer: {layer_bytes:.0f} bytes per object')
+    print(f'Horse: {horse_bytes:.0f} bytes per object (including its {len(datas[0]["layers"]["adult"])} layers)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+"""Offline benchmarks for parsing, model construction and the HTTP client.
+
+Parsing is measured against the pages in benchmarks/corpus, and requests are
+made against the stand-in server in benchmarks/server.py, so no Horse
+Reality account or network access is needed.
+
+With --compare-parsers, nothing is timed. Instead, every page in the corpus
+(or --corpus DIR), and variants of them with markup that is easy to read
+differently in the horse's name and pedigree, is parsed with both engines
+(and the way that lazy horses are read), and this exits with an error if
+their data, their Horse.to_dict() or the errors that they raise differ.
+
+Usage: python benchmarks/run.py [--parse-runs 50] [--requests 200]
+       [--concurrency 1,4,16,64] [--latency 0.02] [--jitter 0.01]
+       [--rate-limit N] [--rollover-every N] [--skip-parse] [--skip-http]
+       python benchmarks/run.py --compare-parsers [--corpus DIR]
+"""
+import argparse
+import asyncio
+import os
+import re
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import horsereality  # noqa: E402
+from horsereality.parsing import PARSERS, parse_horse_page, parse_horse_rest, parse_horse_sidebar  # noqa: E402
+from server import CORPUS_DIR, StandInServer, load_corpus  # noqa: E402
+
+# Markup around the text of the name heading (the `<h1>` in the sidebar)
+NAME_VARIANTS = {
+    'cdata': '<![CDATA[{name}]]>',
+    'cdata inside': '{first} <![CDATA[x]]> {rest}',
+    'comment inside': '{first}<!-- x -->{rest}',
+    'processing instruction': '<?x {name}?>',
+    'entity': '{first} &amp; {rest}',
+    'whitespace': '\n  {name}\n',
+    'empty': '',
+}
+# Markup around the first entry of the pedigree, whose link is `{link}`
+PEDIGREE_VARIANTS = {
+    'unknown sire': '<td class="pedigree_horse">Unknown</td>',
+    'unclosed sire': '<td class="pedigree_horse">',
+    'nested sire': '<td class="pedigree_horse"><table><tr><td class="pedigree_horse">{link}</td></tr></table></td>',
+    'sire in a nested entry': '<td class="pedigree_horse"><span class="pedigree_horse">{link}</span></td>',
+}
+
+
+def percentile(values, percent: float) -> float:
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(percent / 100 * len(values)) - 1))
+    return values[index]
+
+
+def bench_parse(runs: int) -> None:
+    print(f'Parse time per page (median of {runs} runs)')
+    for name, html in load_corpus().items():
+        results = []
+        for parser in PARSERS:
+            timings = []
+            for _ in range(runs):
+                start = time.perf_counter()
+                try:
+                    parse_horse_page(html, parser=parser)
+                except horsereality.PageAlertException:
+                    pass
+                timings.append(time.perf_counter() - start)
+            results.append(f'{parser} {statistics.median(timings) * 1000:7.3f} ms')
+        print(f'  {name:<12} ' + '  '.join(results))
+
+
+# Each engine, and the streaming engine reading the sidebar of a lazy horse
+# first and the rest of the page later
+ENGINES = {
+    **{parser: lambda html, parser=parser: parse_horse_page(html, parser=parser) for parser in PARSERS},
+    'streaming (lazy)': lambda html: parse_horse_rest(parse_horse_sidebar(html)[1]),
+}
+
+
+def parse_outcome(html: str, engine: str):
+    try:
+        data = ENGINES[engine](html)
+    except Exception as exc:
+        return 'error', type(exc).__name__, str(exc)
+    return 'data', data, horsereality.Horse._from_data(None, data).to_dict()
+
+
+def page_variants(name: str, html: str):
+    yield name, html
+    heading = re.search(r'(<div class="horse_left">\s*<h1>)(.*?)(</h1>)', html, re.S)
+    if not heading:
+        return
+    first, _, rest = heading.group(2).strip().partition(' ')
+    for label, markup in NAME_VARIANTS.items():
+        text = markup.format(name=heading.group(2), first=first, rest=rest)
+        yield f'{name} ({label})', html[:heading.start(2)] + text + html[heading.end(2):]
+
+    entry = re.search(r'<td class="pedigree_horse">(<a .*?</a>)</td>', html, re.S)
+    if not entry:
+        return
+    for label, markup in PEDIGREE_VARIANTS.items():
+        text = markup.format(link=entry.group(1))
+        yield f'{name} ({label})', html[:entry.start()] + text + html[entry.end():]
+
+
+def compare_parsers(directory: str) -> int:
+    print('Parser comparison')
+    differences = 0
+    pages = load_corpus(directory)
+    for name, html in pages.items():
+        for label, variant in page_variants(name, html):
+            outcomes = {engine: parse_outcome(variant, engine) for engine in ENGINES}
+            first = outcomes[PARSERS[0]]
+            if all(outcome == first for outcome in outcomes.values()):
+                print(f'  {label:<36} same')
+                continue
+
+            differences += 1
+            print(f'  {label:<36} DIFFERENT')
+            if all(outcome[0] == 'data' for outcome in outcomes.values()):
+                # Only show what differs
+                for index, kind in ((1, 'data'), (2, 'to_dict()')):
+                    keys = sorted(set().union(*(outcome[index] for outcome in outcomes.values())))
+                    for key in keys:
+                        values = {engine: outcome[index].get(key) for engine, outcome in outcomes.items()}
+                        if len(set(map(repr, values.values()))) > 1:
+                            print(f'    {kind} {key}: ' + ', '.join(f'{engine} {value!r}' for engine, value in values.items()))
+            else:
+                for engine, outcome in outcomes.items():
+                    print(f'    {engine}: {outcome[0]} {outcome[1:]!r}'[:300])
+    print(f'  {differences} difference(s) in {len(pages)} pages')
+    return differences
+
+
+def bench_layers(count: int = 100000) -> None:
+    url = 'https://www.horsereality.com/upload/colours/mares/body/large/0123456789abcdef.png'
+    start = time.perf_counter()
+    for _ in range(count):
+        horsereality.Layer(http=None, url=url)
+    elapsed = time.perf_counter() - start
+    print(f'Layer construction: {elapsed / count * 1e6:.2f} us per layer')
+
+
+async def bench_http(args) -> None:
+    server = StandInServer(
+        latency=args.latency,
+        jitter=args.jitter,
+        rate_limit=args.rate_limit,
+        rollover_every=args.rollover_every,
+    )
+    base_url = await server.start()
+
+    print(f'Requests against the stand-in server ({args.requests} horses per level, {args.latency * 1000:.0f} ms latency)')
+    lifenumber = 1
+    try:
+        for concurrency in args.concurrency:
+            client = horsereality.Client(
+                'remember_web_benchmark', 'benchmark',
+                auto_rollover=True,
+                max_concurrency=concurrency,
+                parser=args.parser,
+            )
+            client.http.www_url = client.http.v2_url = base_url
+            await client.verify()
+
+            latencies = []
+            errors = 0
+
+            # Distinct lifenumbers so that requests are not coalesced
+            lifenumbers = iter(range(lifenumber, lifenumber + args.requests))
+            lifenumber += args.requests
+
+            async def worker() -> None:
+                # One request at a time, so that the latencies are those of
+                # single requests rather than of requests waiting for a slot
+                nonlocal errors
+                for number in lifenumbers:
+                    start = time.perf_counter()
+                    try:
+                        await client.get_horse(number)
+                    except horsereality.HorseRealityException:
+                        errors += 1
+                    latencies.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            elapsed = time.perf_counter() - start
+
+            print(
+                f'  concurrency {concurrency:>3}: {args.requests / elapsed:8.1f} req/s  '
+                f'p50 {percentile(latencies, 50) * 1000:8.2f} ms  '
+                f'p99 {percentile(latencies, 99) * 1000:8.2f} ms  '
+                f'errors {errors}'
+            )
+            await client.close()
+    finally:
+        await server.stop()
+
+    print('  server: ' + ', '.join(f'{key} {value}' for key, value in server.stats.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--parse-runs', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=lambda value: [int(part) for part in value.split(',')], default=[1, 4, 16, 64])
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--jitter', type=float, default=0.01)
+    parser.add_argument('--rate-limit', type=float, default=None)
+    parser.add_argument('--rollover-every', type=int, default=None)
+    parser.add_argument('--parser', choices=PARSERS, default='beautifulsoup')
+    parser.add_argument('--skip-parse', action='store_true')
+    parser.add_argument('--skip-http', action='store_true')
+    parser.add_argument('--compare-parsers', action='store_true')
+    parser.add_argument('--corpus', default=CORPUS_DIR)
+    args = parser.parse_args()
+
+    if args.compare_parsers:
+        if compare_parsers(args.corpus):
+            sys.exit(1)
+        return
+
+    if not args.skip_parse:
+        bench_parse(args.parse_runs)
+        bench_layers()
+    if not args.skip_http:
+        asyncio.run(bench_http(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,212 @@
+"""A local stand-in for www.horsereality.com and v2.horsereality.com.
+
+It serves the pages in benchmarks/corpus and simulates the parts of Horse
+Reality that the client has to deal with: the remember-cookie login
+redirects, the daily rollover, 404s and 429s, with configurable latency.
+Both hosts are served from the same address.
+
+Usage: python benchmarks/server.py [--port 8080] [--latency 0.05] [--rate-limit 20] [--rollover-every 500]
+"""
+import argparse
+import asyncio
+import base64
+import glob
+import itertools
+import os
+import random
+import time
+
+from aiohttp import web
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus')
+
+# A 1x1 transparent PNG
+LAYER_PNG = base64.b64decode(
+    'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=='
+)
+ROLLOVER_PAGE = '<html><body><form method="POST"><input type="hidden" name="_token" value="{token}"></form></body></html>'
+
+
+def load_corpus(directory: str = CORPUS_DIR):
+    pages = {}
+    for path in sorted(glob.glob(os.path.join(directory, '*.html'))):
+        with open(path, encoding='utf-8') as fp:
+            pages[os.path.splitext(os.path.basename(path))[0]] = fp.read()
+    return pages
+
+
+class StandInServer:
+    """Serves horse pages for any lifenumber (cycling through the corpus
+    pages that are not errors), except lifenumber 0 which is a 404.
+
+    ``latency`` (seconds, with up to ``jitter`` added at random) is applied
+    to every horse page and layer. If ``rate_limit`` is set, requests beyond
+    that many per second (with a burst of the same size) get a 429. If
+    ``rollover_every`` is set, a rollover is required after that many horse
+    page requests.
+    """
+    def __init__(
+        self,
+        *,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        rate_limit: float = None,
+        rollover_every: int = None,
+        corpus_dir: str = CORPUS_DIR,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.rollover_every = rollover_every
+
+        self.pages = load_corpus(corpus_dir)
+        self.horse_pages = [html for name, html in self.pages.items() if name != 'error_alert']
+
+        self.base_url = None
+        self.sessions = set()
+        self.session_ids = itertools.count(1)
+        self.rollover_pending = False
+        self.tokens = rate_limit or 0.0
+        self.tokens_updated_at = time.monotonic()
+
+        self.stats = {
+            'horse_requests': 0,
+            'layer_requests': 0,
+            'logins': 0,
+            'rollovers': 0,
+            'not_found': 0,
+            'rate_limited': 0,
+        }
+
+        self.app = web.Application()
+        self.app.router.add_get('/login', self.login)
+        self.app.router.add_get('/', self.auth_token)
+        self.app.router.add_get('/daily-rollover', self.rollover_page)
+        self.app.router.add_post('/daily-rollover', self.rollover_submit)
+        self.app.router.add_get('/horses/{lifenumber:\\d+}/', self.horse)
+        self.app.router.add_get('/upload/{path:.+}', self.layer)
+        self.runner = None
+
+    async def start(self, host: str = 'localhost', port: int = 0) -> str:
+        # "localhost" rather than an IP address, since aiohttp's cookie jar
+        # ignores cookies from IP addresses by default.
+        self.runner = web.AppRunner(self.app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f'http://{host}:{port}'
+        return self.base_url
+
+    async def stop(self) -> None:
+        if self.runner:
+            await self.runner.cleanup()
+
+    async def _delay(self) -> None:
+        delay = self.latency + (random.random() * self.jitter if self.jitter else 0.0)
+        if delay:
+            await asyncio.sleep(delay)
+
+    def _rate_limited(self) -> bool:
+        if not self.rate_limit:
+            return False
+        now = time.monotonic()
+        self.tokens = min(self.rate_limit, self.tokens + (now - self.tokens_updated_at) * self.rate_limit)
+        self.tokens_updated_at = now
+        if self.tokens < 1:
+            self.stats['rate_limited'] += 1
+            return True
+        self.tokens -= 1
+        return False
+
+    def _redirect(self, location: str) -> web.Response:
+        return web.Response(status=302, headers={'Location': location})
+
+    async def login(self, request: web.Request) -> web.Response:
+        if self.rollover_pending:
+            return self._redirect(f'{self.base_url}/daily-rollover?url={self.base_url}')
+        self.stats['logins'] += 1
+        return self._redirect(f'{self.base_url}/?v2_auth_token={next(self.session_ids)}')
+
+    async def auth_token(self, request: web.Request) -> web.Response:
+        token = request.query.get('v2_auth_token')
+        if not token:
+            return web.Response(text='<html><body>Home</body></html>', content_type='text/html')
+        self.sessions.add(token)
+        response = self._redirect(f'{self.base_url}/')
+        response.set_cookie('horsereality', token)
+        return response
+
+    async def rollover_page(self, request: web.Request) -> web.Response:
+        if not self.rollover_pending:
+            return self._redirect(request.query.get('url', self.base_url))
+        return web.Response(text=ROLLOVER_PAGE.format(token='rollover-token'), content_type='text/html')
+
+    async def rollover_submit(self, request: web.Request) -> web.Response:
+        form = await request.post()
+        if form.get('_token') == 'rollover-token' and self.rollover_pending:
+            self.rollover_pending = False
+            self.stats['rollovers'] += 1
+        return self._redirect(form.get('url', self.base_url))
+
+    async def horse(self, request: web.Request) -> web.Response:
+        await self._delay()
+        if self._rate_limited():
+            return web.Response(status=429)
+        if request.cookies.get('horsereality') not in self.sessions:
+            return self._redirect(f'{self.base_url}/login')
+        if self.rollover_pending:
+            return self._redirect(f'{self.base_url}/daily-rollover?url={self.base_url}{request.path}')
+
+        self.stats['horse_requests'] += 1
+        if self.rollover_every and self.stats['horse_requests'] % self.rollover_every == 0:
+            # This request still goes through, but the next ones will not
+            self.rollover_pending = True
+
+        lifenumber = int(request.match_info['lifenumber'])
+        if lifenumber == 0:
+            self.stats['not_found'] += 1
+            return web.Response(status=404)
+        html = self.horse_pages[lifenumber % len(self.horse_pages)]
+        return web.Response(text=html, content_type='text/html')
+
+    async def layer(self, request: web.Request) -> web.Response:
+        await self._delay()
+        if self._rate_limited():
+            return web.Response(status=429)
+        self.stats['layer_requests'] += 1
+        return web.Response(body=LAYER_PNG, content_type='image/png')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--rate-limit', type=float, default=None)
+    parser.add_argument('--rollover-every', type=int, default=None)
+    args = parser.parse_args()
+
+    async def serve():
+        server = StandInServer(
+            latency=args.latency,
+            jitter=args.jitter,
+            rate_limit=args.rate_limit,
+            rollover_every=args.rollover_every,
+        )
+        print('Serving on', await server.start(args.host, args.port))
+        try:
+            while True:
+                await asyncio.sleep(3600)
+        finally:
+            await server.stop()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -6,7 +6,77 @@ __author__ = 'shayypy'
 __copyright__ = 'Copyright shay (shayypy) 2022-present'
 __version__ = '1.2.0'
 
-from .client import *
-from .enums import *
-from .errors import *
-from .models import *
+import importlib
+from typing import TYPE_CHECKING
+
+# The public names of each submodule. Submodules (and their dependencies,
+# like aiohttp) are only imported when one of their names is first used, so
+# that scripts which only need part of the library start quickly.
+_modules = {
+    'cache': ('ResponseCache',),
+    'client': ('Client',),
+    'crawl': ('RangeCheckpoint', 'crawl_range'),
+    'database': ('HorseDatabase',),
+    'enums': ('Breed', 'BreedOrders', 'LayerType', 'RequestPriority'),
+    'errors': (
+        'HorseRealityException',
+        'ClientNotInitialized',
+        'HTTPException',
+        'RateLimitExceeded',
+        'AuthenticationException',
+        'PageAlertException',
+        'RolloverRequired',
+        'LayerTooLarge',
+        'ShardFailed',
+    ),
+    'export': ('export_ndjson', 'export_columnar'),
+    'family': ('FamilyCrawlState',),
+    'incremental': ('CrawlState', 'HorseChange', 'refresh_horse'),
+    'index': ('LayerIndex',),
+    'instrumentation': ('Instrumentation', 'InstrumentationEvent'),
+    'models': ('Horse', 'Layer'),
+    'pool': ('ClientPool',),
+    'ratelimit': ('RateBudget', 'RateLimiter'),
+    'render': ('Renderer', 'order_layers'),
+    'schedule': ('next_rollover',),
+    'store': ('LayerStore',),
+    'transport': ('TransportConfig',),
+}
+_exports = {name: module for module, names in _modules.items() for name in names}
+
+__all__ = tuple(_exports)
+
+
+def __getattr__(name: str):
+    module = _exports.get(name)
+    if module is None:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+    value = getattr(importlib.import_module(f'.{module}', __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_exports))
+
+
+if TYPE_CHECKING:
+    from .cache import *
+    from .client import *
+    from .crawl import *
+    from .database import *
+    from .enums import *
+    from .errors import *
+    from .export import *
+    from .family import *
+    from .incremental import *
+    from .index import *
+    from .instrumentation import *
+    from .models import *
+    from .pool import *
+    from .ratelimit import *
+    from .render import *
+    from .schedule import *
+    from .store import *
+    from .transport import *
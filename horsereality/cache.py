@@ -0,0 +1,110 @@
+from collections import OrderedDict
+import sys
+import time
+
+from typing import Any, Dict, Optional, Tuple
+
+__all__ = (
+    'ResponseCache',
+)
+
+
+class ResponseCache:
+    """An in-memory LRU cache for horse pages and layer images, bounded by
+    the approximate number of bytes that the cached responses occupy.
+
+    Horse pages change (horses age, are sold, move...), so they expire after
+    ``horse_ttl`` seconds. Layer images are effectively immutable for a given
+    URL and only expire after ``layer_ttl`` seconds if it is not ``None``.
+    Other pages are never cached.
+    """
+    def __init__(
+        self,
+        *,
+        max_bytes: int = 64 * 1024 * 1024,
+        horse_ttl: Optional[float] = 300.0,
+        layer_ttl: Optional[float] = None,
+    ):
+        if max_bytes < 1:
+            raise ValueError('max_bytes must be at least 1')
+
+        self.max_bytes: int = max_bytes
+        self.horse_ttl: Optional[float] = horse_ttl
+        self.layer_ttl: Optional[float] = layer_ttl
+
+        # url: (expires_at, size, response)
+        self._entries: 'OrderedDict[str, Tuple[Optional[float], int, Dict[str, Any]]]' = OrderedDict()
+        self.size: int = 0
+
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        self.expirations: int = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def is_cacheable(path: str) -> bool:
+        return path.startswith('/horses/') or path.startswith('/upload/')
+
+    def _ttl_for(self, path: str) -> Optional[float]:
+        return self.layer_ttl if path.startswith('/upload/') else self.horse_ttl
+
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        """Return the cached response for ``url``, or ``None`` if there is
+        no fresh entry for it."""
+        entry = self._entries.get(url)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, size, response = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._entries[url]
+            self.size -= size
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(url)
+        self.hits += 1
+        return response
+
+    def put(self, url: str, path: str, response: Dict[str, Any]) -> None:
+        """Cache ``response`` for ``url``, evicting the least recently used
+        entries until the cache fits within ``max_bytes``."""
+        size = sys.getsizeof(response['data'])
+        if size > self.max_bytes:
+            # This would evict everything else and still not fit
+            return
+
+        ttl = self._ttl_for(path)
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+
+        old = self._entries.pop(url, None)
+        if old is not None:
+            self.size -= old[1]
+
+        self._entries[url] = (expires_at, size, response)
+        self.size += size
+
+        while self.size > self.max_bytes:
+            _, (_, evicted_size, _) = self._entries.popitem(last=False)
+            self.size -= evicted_size
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.size = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Return the cache's counters as a dict."""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'entries': len(self._entries),
+            'size': self.size,
+        }
@@ -1,5 +1,20 @@
+import asyncio
+from concurrent.futures import Executor
+import warnings
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterable, Optional, Tuple, Union
+
+from .cache import ResponseCache
+from .enums import RequestPriority
+from .family import FamilyCrawlState, relatives
+from .incremental import CrawlState, HorseChange, refresh_horse
+from .index import LayerIndex
+from .instrumentation import Instrumentation
 from .models import Layer, Horse
-from .http import HTTPClient
+from .http import HTTPClient, SingleFlight
+from .ratelimit import RateLimiter
+from .render import Renderer
+from .store import LayerStore
+from .transport import TransportConfig
 
 
 __all__ = (
@@ -7,6 +22,59 @@ __all__ = (
 )
 
 
+async def _pipeline(
+    lifenumbers: Iterable[int],
+    func: Callable[[int], Awaitable[Any]],
+    *,
+    ordered: bool,
+    concurrency: int,
+) -> AsyncIterator[Tuple[int, Any]]:
+    # Runs `func` for every lifenumber with at most `concurrency` in flight,
+    # yielding (lifenumber, result or exception) tuples
+    if concurrency < 1:
+        raise ValueError('concurrency must be at least 1')
+
+    async def run(lifenumber: int):
+        try:
+            return lifenumber, await func(lifenumber)
+        except Exception as exc:
+            # One bad lifenumber (or page that could not be parsed) must not
+            # end the whole batch
+            return lifenumber, exc
+
+    lifenumbers = iter(lifenumbers)
+    pending = []
+
+    def fill():
+        while len(pending) < concurrency:
+            try:
+                lifenumber = next(lifenumbers)
+            except StopIteration:
+                return
+            pending.append(asyncio.ensure_future(run(lifenumber)))
+
+    try:
+        fill()
+        while pending:
+            if ordered:
+                done = [pending.pop(0)]
+                await done[0]
+            else:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    pending.remove(task)
+
+            # Keep the pipeline full while the consumer handles results
+            fill()
+            for task in done:
+                yield task.result()
+    finally:
+        # The consumer stopped iterating early (or something went wrong),
+        # so there is no reason to keep going.
+        for task in pending:
+            task.cancel()
+
+
 class Client:
     """Basic client for reading pages."""
     def __init__(
@@ -16,24 +84,209 @@ class Client:
         *,
         auto_rollover: bool = False,
         allow_unverified_client: bool = False,
+        max_concurrency: int = 10,
+        parse_executor: Optional[Executor] = None,
+        parser: str = 'beautifulsoup',
+        cache: Optional[ResponseCache] = None,
+        layer_store: Optional[LayerStore] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        renderer: Optional[Renderer] = None,
+        instrumentation: Optional[Instrumentation] = None,
+        transport: Optional[TransportConfig] = None,
+        scheduled_rollover: bool = False,
+        session_lifetime: Optional[float] = None,
+        layer_index: Optional[LayerIndex] = None,
+        derive_layer_sizes: bool = False,
     ):
         self.http = HTTPClient(
             remember_cookie_name,
             remember_cookie_value,
             auto_rollover=auto_rollover,
             allow_unverified_client=allow_unverified_client,
+            max_concurrency=max_concurrency,
+            parse_executor=parse_executor,
+            parser=parser,
+            cache=cache,
+            layer_store=layer_store,
+            rate_limiter=rate_limiter,
+            renderer=renderer,
+            instrumentation=instrumentation,
+            transport=transport,
+            scheduled_rollover=scheduled_rollover,
+            session_lifetime=session_lifetime,
+            derive_layer_sizes=derive_layer_sizes,
         )
 
+        # Concurrent get_horse calls for the same horse share one fetch and
+        # one parse
+        self._horse_flights = SingleFlight()
+
+        # Horses that are fetched are added to this, if provided
+        self.layer_index: Optional[LayerIndex] = layer_index
+
     async def verify(self) -> None:
         """Prime the client for use."""
         await self.http.initialize()
 
-    async def get_horse(self, lifenumber: int) -> Horse:
-        """:class:`Horse`: Fetch a horse from Horse Reality."""
-        html_text = await self.http.get_horse(lifenumber)
-        horse = await Horse._from_page(http=self.http, html_text=html_text)
+    async def get_horse(
+        self,
+        lifenumber: int,
+        *,
+        priority: RequestPriority = RequestPriority.normal,
+        lazy: bool = False,
+    ) -> Horse:
+        """:class:`Horse`: Fetch a horse from Horse Reality.
+
+        If ``lazy`` is ``True``, only the sidebar of the page (e.g. the name,
+        sex, breed and owner) is read up front, and only the part of the page
+        after it is kept until :meth:`Horse.load` or the first access to one
+        of the other details reads it. This requires the ``'streaming'``
+        parser.
+        """
+        if lazy and self.http.parser != 'streaming':
+            raise ValueError("Lazy horses can only be read with the 'streaming' parser.")
+        return await self._horse_flights.run((lifenumber, lazy), self._get_horse, lifenumber, priority, lazy)
+
+    async def _get_horse(self, lifenumber: int, priority: RequestPriority, lazy: bool) -> Horse:
+        html_text = await self.http.get_horse(lifenumber, priority=priority)
+        horse = await Horse._from_page(http=self.http, html_text=html_text, lazy=lazy)
+        if self.layer_index is not None:
+            if horse.is_lazy:
+                # Its layers are not known yet
+                horse._on_load = self.layer_index.add
+            else:
+                self.layer_index.add(horse)
         return horse
 
+    async def get_horses(
+        self,
+        lifenumbers: Iterable[int],
+        *,
+        ordered: bool = False,
+        concurrency: Optional[int] = None,
+        priority: RequestPriority = RequestPriority.low,
+        lazy: bool = False,
+    ) -> AsyncIterator[Tuple[int, Union[Horse, Exception]]]:
+        """Fetch many horses at once.
+
+        This is an async iterator of ``(lifenumber, result)`` tuples, where
+        ``result`` is either the :class:`Horse` or the exception that was
+        raised while fetching it, so that one bad lifenumber does not fail
+        the whole batch. Results are yielded as soon as they are ready unless
+        ``ordered`` is ``True``, in which case they are yielded in the same
+        order as ``lifenumbers``.
+
+        At most ``concurrency`` horses (by default, the client's
+        ``max_concurrency``) are fetched at once, and pages are parsed in the
+        client's parse executor so that parsing does not block the event loop.
+        If the client has a rate limiter, these requests are sent with a low
+        ``priority`` by default so that they give way to individual lookups.
+        ``lazy`` is passed on to :meth:`get_horse`.
+        """
+        if lazy and self.http.parser != 'streaming':
+            raise ValueError("Lazy horses can only be read with the 'streaming' parser.")
+        async for result in _pipeline(
+            lifenumbers,
+            lambda lifenumber: self.get_horse(lifenumber, priority=priority, lazy=lazy),
+            ordered=ordered,
+            concurrency=concurrency or self.http.max_concurrency,
+        ):
+            yield result
+
+    async def refresh_horses(
+        self,
+        lifenumbers: Iterable[int],
+        state: CrawlState,
+        *,
+        ordered: bool = False,
+        concurrency: Optional[int] = None,
+        priority: RequestPriority = RequestPriority.low,
+    ) -> AsyncIterator[Tuple[int, Union[HorseChange, Exception]]]:
+        """Re-crawl horses, only processing the ones that changed since they
+        were last recorded in ``state``.
+
+        This works like :meth:`get_horses`, but yields a :class:`HorseChange`
+        for each horse, which only has a :class:`Horse` if the horse is new
+        or has changed. ``state`` is updated as results come in; call
+        :meth:`CrawlState.save` to persist it.
+        """
+        async for lifenumber, result in _pipeline(
+            lifenumbers,
+            lambda lifenumber: refresh_horse(self.http, lifenumber, state, priority=priority),
+            ordered=ordered,
+            concurrency=concurrency or self.http.max_concurrency,
+        ):
+            if self.layer_index is not None and isinstance(result, HorseChange) and result.horse is not None:
+                self.layer_index.add(result.horse)
+            yield lifenumber, result
+
+    async def close(self) -> None:
+        """Close the client's session and connections. The client cannot be
+        used again until :meth:`verify` is called."""
+        await self.http.close()
+
+    async def crawl_family(
+        self,
+        lifenumbers: Iterable[int],
+        *,
+        depth: int = 1,
+        parents: bool = True,
+        offspring: bool = True,
+        state: Optional[FamilyCrawlState] = None,
+        concurrency: Optional[int] = None,
+        priority: RequestPriority = RequestPriority.low,
+    ) -> AsyncIterator[Tuple[int, Union[Horse, Exception]]]:
+        """Fetch the horses in ``lifenumbers`` and their relatives up to
+        ``depth`` generations away, breadth-first.
+
+        Relatives are read from each horse's page: its sire and dam if
+        ``parents`` is ``True``, and its offspring if ``offspring`` is
+        ``True``. Each horse is only fetched once. This yields ``(lifenumber,
+        result)`` tuples like :meth:`get_horses`, one generation at a time,
+        and horses that could not be fetched are not expanded.
+
+        Progress is recorded in ``state``. Horses that it has already
+        recorded as fetched are skipped, so an interrupted crawl can be
+        resumed by passing a saved :class:`FamilyCrawlState` again.
+
+        Every horse page has a pedigree, so a ``RuntimeWarning`` is issued
+        (once per crawl) if one is fetched without any pedigree entries, in
+        case the layout of the pages has changed.
+        """
+        if depth < 0:
+            raise ValueError('depth cannot be negative')
+        if state is None:
+            state = FamilyCrawlState()
+        warned = False
+
+        for lifenumber in lifenumbers:
+            state.add(lifenumber, 0)
+
+        for generation in range(depth + 1):
+            pending = state.pending(generation)
+            if not pending:
+                continue
+
+            async for lifenumber, result in _pipeline(
+                pending,
+                lambda lifenumber: self.get_horse(lifenumber, priority=priority),
+                ordered=False,
+                concurrency=concurrency or self.http.max_concurrency,
+            ):
+                if isinstance(result, Horse):
+                    state.done.add(lifenumber)
+                    if not result.pedigree and not warned:
+                        warned = True
+                        warnings.warn(
+                            f'No pedigree was found on the page of horse {lifenumber}, so its parents cannot be '
+                            'crawled. The layout of horse pages may have changed.',
+                            RuntimeWarning,
+                        )
+                    if generation < depth:
+                        for relative in relatives(result, parents=parents, offspring=offspring):
+                            state.add(relative, generation + 1)
+                yield lifenumber, result
+
     def create_layer(self, url: str) -> Layer:
         """:class:`Layer`: A helper function to create a :class:`Layer` from a one-off layer URL."""
         return Layer(http=self.http, url=url)
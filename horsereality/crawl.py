@@ -0,0 +1,235 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+import json
+import multiprocessing
+from multiprocessing import util
+import os
+
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from .client import Client
+from .enums import RequestPriority
+from .errors import HTTPException, PageAlertException, RateLimitExceeded, ShardFailed
+from .export import export_ndjson
+from .ratelimit import RateBudget, RateLimiter
+from .utils import atomic_write
+
+__all__ = (
+    'RangeCheckpoint',
+    'crawl_range',
+)
+
+
+class RangeCheckpoint:
+    """The lifenumber ranges of a :func:`crawl_range` that are complete, and
+    how many horses were written for each.
+
+    If ``path`` is provided, the checkpoint is loaded from it and
+    :meth:`save` writes it back to it as JSON.
+    """
+    def __init__(self, path: Optional[str] = None):
+        self.path: Optional[str] = path
+        # (start, stop) -> horses written
+        self.ranges: Dict[Tuple[int, int], int] = {}
+
+        if path and os.path.exists(path):
+            with open(path, encoding='utf-8') as fp:
+                self.ranges = {(start, stop): count for start, stop, count in json.load(fp)['ranges']}
+
+    def __contains__(self, range: Tuple[int, int]) -> bool:
+        return tuple(range) in self.ranges
+
+    def __len__(self) -> int:
+        return len(self.ranges)
+
+    def add(self, start: int, stop: int, count: int) -> None:
+        self.ranges[(start, stop)] = count
+
+    def save(self) -> None:
+        if not self.path:
+            raise ValueError('This checkpoint has no path to save to.')
+
+        with atomic_write(self.path) as fp:
+            json.dump({'ranges': [[start, stop, count] for (start, stop), count in sorted(self.ranges.items())]}, fp)
+
+
+def shard_path(output: str, start: int, stop: int) -> str:
+    """Where :func:`crawl_range` writes the horses in ``start`` to
+    ``stop - 1``."""
+    return os.path.join(output, f'{start:010d}-{stop:010d}.ndjson')
+
+
+# The event loop and client of a crawl worker process
+_worker: Optional[Tuple[asyncio.AbstractEventLoop, Client]] = None
+
+
+def _start_worker(
+    credentials: List[Tuple[str, str]],
+    counter,
+    budget: RateBudget,
+    client_factory: Callable[..., Client],
+    client_options: Dict[str, Any],
+) -> None:
+    global _worker
+
+    # Spread the processes over the accounts
+    with counter.get_lock():
+        index = counter.value
+        counter.value += 1
+    remember_cookie_name, remember_cookie_value = credentials[index % len(credentials)]
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    client = client_factory(
+        remember_cookie_name,
+        remember_cookie_value,
+        rate_limiter=RateLimiter(budget.rate, budget.burst, budget=budget),
+        **client_options,
+    )
+    _worker = (loop, client)
+    util.Finalize(client, _stop_worker, args=(loop, client), exitpriority=10)
+
+
+def _stop_worker(loop: asyncio.AbstractEventLoop, client: Client) -> None:
+    loop.run_until_complete(client.close())
+    loop.close()
+
+
+def _crawl_shard(start: int, stop: int, path: str, concurrency: Optional[int]) -> int:
+    loop, client = _worker
+    try:
+        return loop.run_until_complete(_write_shard(client, start, stop, path, concurrency))
+    except Exception as exc:
+        raise ShardFailed(start, stop, type(exc).__name__, str(exc)) from None
+
+
+async def _write_shard(client: Client, start: int, stop: int, path: str, concurrency: Optional[int]) -> int:
+    http = client.http
+    if http.session is None or http.session.closed:
+        # This is the worker's first shard, or the client was uninitialized
+        # after being rate limited. Its requests would fail fast until the
+        # cooldown is over, so the worker waits it out and logs in again
+        # instead of failing every shard until then.
+        await asyncio.sleep(http.login_cooldown())
+        if http.rate_limiter is not None:
+            # Also wait for the workers' pause, since logging in sends requests
+            await http.rate_limiter.acquire(RequestPriority.high)
+        try:
+            await client.verify()
+        except RateLimitExceeded:
+            # The next shard waits for the cooldown before trying again
+            await http.uninitialize('rate limited while logging in')
+            raise
+
+    async def horses():
+        async for _, result in client.get_horses(range(start, stop), concurrency=concurrency):
+            if isinstance(result, Exception):
+                if isinstance(result, PageAlertException) or (isinstance(result, HTTPException) and result.status == 404):
+                    # The horse does not exist (anymore)
+                    continue
+                # Anything else fails the shard, so that it is crawled
+                # again instead of being recorded with horses missing
+                raise result
+            yield result
+
+    # The shard's file only appears once all of it is written
+    with atomic_write(path) as fp:
+        return await export_ndjson(horses(), fp)
+
+
+async def crawl_range(
+    credentials: Iterable[Tuple[str, str]],
+    start: int,
+    stop: int,
+    output: str,
+    *,
+    shard_size: int = 1000,
+    processes: Optional[int] = None,
+    rate: float = 2.0,
+    burst: int = 5,
+    concurrency: Optional[int] = None,
+    checkpoint: Optional[RangeCheckpoint] = None,
+    client_factory: Callable[..., Client] = Client,
+    client_options: Optional[Dict[str, Any]] = None,
+) -> AsyncIterator[Tuple[int, int, Union[int, Exception]]]:
+    """Crawl every horse from ``start`` to ``stop - 1`` with a pool of
+    ``processes`` (by default, one per CPU) worker processes, so that
+    parsing is not limited to one core.
+
+    The range is split into shards of ``shard_size`` lifenumbers, and each
+    worker fetches its shards with its own event loop and client (made with
+    ``client_factory(remember_cookie_name, remember_cookie_value,
+    rate_limiter=..., **client_options)``), taking turns between the
+    ``credentials``. The workers share a :class:`RateBudget` of ``rate``
+    requests per second, with bursts of up to ``burst``, and a rate limited
+    response pauses all of them. ``concurrency`` is passed on to
+    :meth:`Client.get_horses` in each worker.
+
+    Each shard is written to ``output`` as NDJSON (see :func:`export_ndjson`)
+    once all of it has been fetched, skipping horses that do not exist.
+    This is an async iterator of ``(start, stop, result)`` tuples for each
+    shard, where ``result`` is the number of horses written or the exception
+    that failed the shard: a :exc:`ShardFailed` describing what went wrong
+    (e.g. :exc:`RateLimitExceeded`), or ``BrokenProcessPool`` if a worker
+    crashed. A worker whose session was closed after being rate limited
+    waits out the client's cooldown and logs in again before its next
+    shard. Completed shards are recorded in ``checkpoint`` (by default,
+    ``checkpoint.json`` in ``output``), which is saved after each one, so
+    running the crawl again only fetches the shards that were not
+    completed.
+    """
+    credentials = list(credentials)
+    if not credentials:
+        raise ValueError('At least one set of credentials is required')
+    if shard_size < 1:
+        raise ValueError('shard_size must be at least 1')
+
+    os.makedirs(output, exist_ok=True)
+    if checkpoint is None:
+        checkpoint = RangeCheckpoint(os.path.join(output, 'checkpoint.json'))
+
+    shards = [
+        (shard_start, min(shard_start + shard_size, stop))
+        for shard_start in range(start, stop, shard_size)
+        if (shard_start, min(shard_start + shard_size, stop)) not in checkpoint
+    ]
+    if not shards:
+        return
+
+    # Forked children would inherit the parent's event loop, so the workers
+    # are started from scratch
+    context = multiprocessing.get_context('spawn')
+    budget = RateBudget(rate, burst, context=context)
+    executor = ProcessPoolExecutor(
+        max_workers=min(processes or os.cpu_count() or 1, len(shards)),
+        mp_context=context,
+        initializer=_start_worker,
+        initargs=(credentials, context.Value('i', 0), budget, client_factory, client_options or {}),
+    )
+
+    loop = asyncio.get_event_loop()
+    futures = {
+        loop.run_in_executor(executor, _crawl_shard, shard_start, shard_stop, shard_path(output, shard_start, shard_stop), concurrency): (shard_start, shard_stop)
+        for shard_start, shard_stop in shards
+    }
+    try:
+        while futures:
+            done, _ = await asyncio.wait(futures, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                shard_start, shard_stop = futures.pop(future)
+                try:
+                    result = future.result()
+                except Exception as exc:
+                    yield shard_start, shard_stop, exc
+                    continue
+
+                checkpoint.add(shard_start, shard_stop, result)
+                if checkpoint.path:
+                    checkpoint.save()
+                yield shard_start, shard_stop, result
+    finally:
+        # Shards that have not started are dropped, and the workers exit
+        # once the shards that they are on are done
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=False)
@@ -0,0 +1,240 @@
+import datetime
+import sqlite3
+import time
+
+from typing import Iterable, List, Optional, Union
+
+from .enums import Breed
+from .models import Horse, Layer
+
+__all__ = (
+    'HorseDatabase',
+)
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS horses (
+    lifenumber INTEGER PRIMARY KEY,
+    name TEXT,
+    sex TEXT,
+    breed TEXT,
+    raw_breed TEXT,
+    age TEXT,
+    birthdate TEXT,
+    birthdate_iso TEXT,
+    height TEXT,
+    location TEXT,
+    owner TEXT,
+    registry TEXT,
+    predicates TEXT,
+    looking_at TEXT,
+    is_foal INTEGER NOT NULL,
+    foal_lifenumber INTEGER,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS horses_breed ON horses (breed);
+CREATE INDEX IF NOT EXISTS horses_sex ON horses (sex);
+CREATE INDEX IF NOT EXISTS horses_owner ON horses (owner);
+CREATE INDEX IF NOT EXISTS horses_location ON horses (location);
+CREATE INDEX IF NOT EXISTS horses_birthdate ON horses (birthdate_iso);
+
+CREATE TABLE IF NOT EXISTS layers (
+    lifenumber INTEGER NOT NULL REFERENCES horses (lifenumber) ON DELETE CASCADE,
+    slot TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    horse_type TEXT NOT NULL,
+    body_part TEXT NOT NULL,
+    size TEXT NOT NULL,
+    id TEXT NOT NULL,
+    PRIMARY KEY (lifenumber, slot, position)
+);
+CREATE INDEX IF NOT EXISTS layers_id ON layers (type, horse_type, body_part, id);
+'''
+
+
+class HorseDatabase:
+    """A local SQLite database of horses, for answering questions about
+    horses that have already been fetched without going back to Horse
+    Reality.
+
+    Horses are looked up by lifenumber or queried by breed, sex, owner,
+    location, birthdate and whether they are foals, and are returned as
+    :class:`Horse` objects. If ``client`` is provided, the layers of returned
+    horses can be read with it.
+
+    Queries are synchronous, since they only touch the local database.
+    """
+    def __init__(self, path: str, *, client=None):
+        self.path: str = path
+        self._http = client.http if client is not None else None
+
+        self.connection = sqlite3.connect(path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute('PRAGMA foreign_keys = ON')
+        self.connection.execute('PRAGMA journal_mode = WAL')
+        self.connection.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def __len__(self) -> int:
+        return self.connection.execute('SELECT COUNT(*) FROM horses').fetchone()[0]
+
+    def upsert(self, horse: Horse) -> None:
+        """Insert ``horse``, or replace the stored horse with the same
+        lifenumber."""
+        self.upsert_many((horse,))
+
+    def upsert_many(self, horses: Iterable[Horse]) -> None:
+        """Insert or replace several horses in a single transaction."""
+        now = time.time()
+        with self.connection:
+            for horse in horses:
+                self._upsert(horse, now)
+
+    def _upsert(self, horse: Horse, now: float) -> None:
+        try:
+            birthdate_iso = horse.birthdate_date.isoformat()
+        except (AttributeError, ValueError):
+            birthdate_iso = None
+
+        self.connection.execute(
+            'INSERT OR REPLACE INTO horses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (
+                horse.lifenumber,
+                horse.name,
+                horse.sex,
+                horse.breed,
+                horse.raw_breed,
+                horse.age,
+                horse.birthdate,
+                birthdate_iso,
+                horse.height,
+                horse.location,
+                horse.owner,
+                horse.registry,
+                horse.predicates,
+                horse.looking_at,
+                horse.is_foal(),
+                horse.foal_lifenumber,
+                now,
+            ),
+        )
+        # INSERT OR REPLACE deletes the old row, which cascades to its layers
+        self.connection.executemany(
+            'INSERT INTO layers VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            [
+                (horse.lifenumber, slot, position, layer.type.value, layer.horse_type, layer.body_part, layer.size, layer.id)
+                for slot, layers in (('adult', horse.adult_layers), ('foal', horse.foal_layers))
+                for position, layer in enumerate(layers)
+            ],
+        )
+
+    def delete(self, lifenumber: int) -> None:
+        with self.connection:
+            self.connection.execute('DELETE FROM horses WHERE lifenumber = ?', (lifenumber,))
+
+    def get(self, lifenumber: int) -> Optional[Horse]:
+        """Optional[:class:`Horse`]: The stored horse with ``lifenumber``."""
+        horses = self._horses('SELECT * FROM horses WHERE lifenumber = ?', (lifenumber,))
+        return horses[0] if horses else None
+
+    def query(
+        self,
+        *,
+        breed: Union[Breed, str, None] = None,
+        sex: Optional[str] = None,
+        owner: Optional[str] = None,
+        location: Optional[str] = None,
+        born_after: Optional[datetime.date] = None,
+        born_before: Optional[datetime.date] = None,
+        foal: Optional[bool] = None,
+        limit: Optional[int] = None,
+        offset: int = 0,
+    ) -> List[Horse]:
+        """List[:class:`Horse`]: Stored horses matching every filter that is
+        provided, ordered by lifenumber.
+
+        ``breed`` may be a :class:`Breed` or the same value as
+        :attr:`Horse.breed` (e.g. ``'brumby_horse'``). ``born_after`` and
+        ``born_before`` are inclusive.
+        """
+        clauses = []
+        params = []
+        if breed is not None:
+            clauses.append('breed = ?')
+            params.append(breed.name if isinstance(breed, Breed) else breed)
+        for column, value in (('sex', sex), ('owner', owner), ('location', location)):
+            if value is not None:
+                clauses.append(f'{column} = ?')
+                params.append(value)
+        if born_after is not None:
+            clauses.append('birthdate_iso >= ?')
+            params.append(born_after.isoformat())
+        if born_before is not None:
+            clauses.append('birthdate_iso <= ?')
+            params.append(born_before.isoformat())
+        if foal is not None:
+            clauses.append('is_foal = ?')
+            params.append(int(foal))
+
+        sql = 'SELECT * FROM horses'
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        sql += ' ORDER BY lifenumber'
+        if limit is not None:
+            sql += ' LIMIT ? OFFSET ?'
+            params += [limit, offset]
+        elif offset:
+            sql += ' LIMIT -1 OFFSET ?'
+            params.append(offset)
+
+        return self._horses(sql, params)
+
+    def _horses(self, sql: str, params) -> List[Horse]:
+        rows = self.connection.execute(sql, params).fetchall()
+        if not rows:
+            return []
+
+        layers = {row['lifenumber']: {'adult': [], 'foal': []} for row in rows}
+        lifenumbers = list(layers)
+        # Stay well below SQLite's limit on the number of parameters
+        for index in range(0, len(lifenumbers), 500):
+            chunk = lifenumbers[index:index + 500]
+            layer_rows = self.connection.execute(
+                f'SELECT * FROM layers WHERE lifenumber IN ({", ".join("?" * len(chunk))}) ORDER BY lifenumber, slot, position',
+                chunk,
+            )
+            for layer in layer_rows:
+                url = f'/upload/{layer["type"]}/{layer["horse_type"]}/{layer["body_part"]}/{layer["size"]}/{layer["id"]}.png'
+                layers[layer['lifenumber']][layer['slot']].append(Layer(http=self._http, url=url))
+
+        horses = []
+        for row in rows:
+            data = {
+                'lifenumber': row['lifenumber'],
+                'name': row['name'],
+                'sex': row['sex'],
+                'breed': row['raw_breed'],
+                'age': row['age'],
+                'birthdate': row['birthdate'],
+                'horse_height': row['height'],
+                'location': row['location'],
+                'owner': row['owner'],
+                'registry': row['registry'],
+                'predicates': row['predicates'],
+                'layers': layers[row['lifenumber']],
+                'foal_lifenumber': row['foal_lifenumber'],
+            }
+            if row['looking_at'] is not None:
+                data['looking_at'] = row['looking_at']
+            horses.append(Horse(http=self._http, data=data))
+
+        return horses
@@ -1,10 +1,11 @@
-from enum import Enum
+from enum import Enum, IntEnum
 
 
 __all__ = (
     'Breed',
     'BreedOrders',
     'LayerType',
+    'RequestPriority',
 )
 
 
@@ -158,3 +159,9 @@ class LayerType(Enum):
     colours = 'colours'
     colors = 'colours'
     whites = 'whites'
+
+
+class RequestPriority(IntEnum):
+    high = 0
+    normal = 1
+    low = 2
@@ -1,4 +1,7 @@
-import aiohttp
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import aiohttp
 
 __all__ = (
     'HorseRealityException',
@@ -8,6 +11,8 @@ __all__ = (
     'AuthenticationException',
     'PageAlertException',
     'RolloverRequired',
+    'LayerTooLarge',
+    'ShardFailed',
 )
 
 
@@ -26,7 +31,7 @@ class ClientNotInitialized(HorseRealityException):
 
 
 class HTTPException(HorseRealityException):
-    def __init__(self, response: aiohttp.ClientResponse, message: str):
+    def __init__(self, response: 'aiohttp.ClientResponse', message: str):
         self.response = response
         self.status = response.status
         self.message = message
@@ -34,7 +39,7 @@ class HTTPException(HorseRealityException):
 
 
 class RateLimitExceeded(HorseRealityException):
-    def __init__(self, response: aiohttp.ClientResponse, message: str = None):
+    def __init__(self, response: 'aiohttp.ClientResponse', message: str = None):
         self.response = response
         self.status = response.status
         self.message = message or 'Client is rate limited or banned by Cloudflare. Try again later.'
@@ -52,8 +57,29 @@ class PageAlertException(HorseRealityException):
 
 
 class RolloverRequired(HorseRealityException):
-    def __init__(self, url: str, response: aiohttp.ClientResponse):
+    def __init__(self, url: str, response: 'aiohttp.ClientResponse'):
         self.url = url
         self.response = response
         self.rollover_url: str = response.headers.get('location')
         super().__init__('Failed to access %s because the client has not rolled over.' % url)
+
+
+class LayerTooLarge(HorseRealityException):
+    def __init__(self, path: str, max_size: int):
+        self.path = path
+        self.max_size = max_size
+        super().__init__(f'The layer image at {path} is larger than {max_size} bytes.')
+
+
+class ShardFailed(HorseRealityException):
+    def __init__(self, start: int, stop: int, error_type: str, error: str):
+        self.start = start
+        self.stop = stop
+        # The exception is described rather than kept, since it is raised in
+        # a worker process and most exceptions cannot be pickled
+        self.error_type = error_type
+        self.error = error
+        super().__init__(f'Failed to crawl horses {start} to {stop - 1}: {error_type}: {error}')
+
+    def __reduce__(self):
+        return (ShardFailed, (self.start, self.stop, self.error_type, self.error))
@@ -0,0 +1,145 @@
+import asyncio
+import csv
+import io
+import json
+
+from typing import Any, AsyncIterable, Dict, List, Optional
+
+from .models import Horse
+from .utils import import_optional
+
+__all__ = (
+    'export_ndjson',
+    'export_columnar',
+)
+
+
+SCALAR_COLUMNS = (
+    'lifenumber',
+    'name',
+    'sex',
+    'age',
+    'birthdate',
+    'breed',
+    'height',
+    'location',
+    'owner',
+    'registry',
+    'predicates',
+    'foal',
+    'foal_lifenumber',
+)
+LAYER_FIELDS = ('type', 'horse_type', 'body_part', 'size', 'id')
+
+
+async def export_ndjson(horses: AsyncIterable[Horse], fp) -> int:
+    """Write each horse in ``horses`` as a line of JSON (the output of
+    :meth:`Horse.to_dict`) as soon as it arrives, so that only one horse is
+    held in memory at a time. Returns the number of horses written.
+
+    ``fp`` may be a text or binary file object or an
+    :class:`asyncio.StreamWriter` (e.g. a socket), which is drained after
+    every line.
+    """
+    is_stream = isinstance(fp, asyncio.StreamWriter)
+    is_binary = is_stream or isinstance(fp, (io.RawIOBase, io.BufferedIOBase)) or 'b' in getattr(fp, 'mode', '')
+
+    count = 0
+    async for horse in horses:
+        line = json.dumps(horse.to_dict(), ensure_ascii=False) + '\n'
+        fp.write(line.encode('utf-8') if is_binary else line)
+        if is_stream:
+            await fp.drain()
+        count += 1
+
+    return count
+
+
+def _csv_row(horse: Dict[str, Any]) -> Dict[str, Any]:
+    row = {column: horse[column] for column in SCALAR_COLUMNS}
+    # Each layer field becomes its own column of semicolon-separated values
+    # that line up with each other
+    for field in LAYER_FIELDS:
+        row[f'layer_{field}'] = ';'.join(layer[field] for layer in horse['layers'])
+    return row
+
+
+def _arrow_schema():
+    pyarrow = import_optional('pyarrow')
+    string = pyarrow.string()
+    return pyarrow.schema(
+        [
+            ('lifenumber', pyarrow.int64()),
+            ('name', string),
+            ('sex', string),
+            ('age', string),
+            ('birthdate', string),
+            ('breed', string),
+            ('height', string),
+            ('location', string),
+            ('owner', string),
+            ('registry', string),
+            ('predicates', string),
+            ('foal', pyarrow.bool_()),
+            ('foal_lifenumber', pyarrow.int64()),
+            ('layers', pyarrow.list_(pyarrow.struct([(field, string) for field in LAYER_FIELDS]))),
+        ]
+    )
+
+
+async def export_columnar(
+    horses: AsyncIterable[Horse],
+    path: str,
+    *,
+    format: Optional[str] = None,
+    batch_size: int = 1000,
+) -> int:
+    """Write ``horses`` to ``path`` in a columnar format, ``batch_size``
+    horses at a time. Returns the number of horses written.
+
+    ``format`` may be ``'parquet'``, which requires pyarrow and stores each
+    horse's layers as a list column, or ``'csv'``, which stores them as
+    ``layer_type``, ``layer_horse_type``, ``layer_body_part``, ``layer_size``
+    and ``layer_id`` columns of semicolon-separated values. By default,
+    Parquet is used if pyarrow is installed and CSV otherwise.
+    """
+    pyarrow = import_optional('pyarrow')
+    if format is None:
+        format = 'parquet' if pyarrow is not None else 'csv'
+    if format not in ('parquet', 'csv'):
+        raise ValueError(f'Unknown format {format!r}')
+    if format == 'parquet' and pyarrow is None:
+        raise RuntimeError('Exporting to Parquet requires pyarrow to be installed.')
+    if batch_size < 1:
+        raise ValueError('batch_size must be at least 1')
+
+    loop = asyncio.get_event_loop()
+    if format == 'parquet':
+        schema = _arrow_schema()
+        writer = import_optional('pyarrow.parquet').ParquetWriter(path, schema)
+        write_batch = lambda batch: writer.write_table(pyarrow.Table.from_pylist(batch, schema=schema))
+        close = writer.close
+    else:
+        fp = open(path, 'w', newline='', encoding='utf-8')
+        columns = list(SCALAR_COLUMNS) + [f'layer_{field}' for field in LAYER_FIELDS]
+        writer = csv.DictWriter(fp, fieldnames=columns)
+        writer.writeheader()
+        write_batch = lambda batch: writer.writerows(_csv_row(horse) for horse in batch)
+        close = fp.close
+
+    count = 0
+    batch: List[Dict[str, Any]] = []
+    try:
+        async for horse in horses:
+            batch.append(horse.to_dict())
+            if len(batch) >= batch_size:
+                await loop.run_in_executor(None, write_batch, batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            await loop.run_in_executor(None, write_batch, batch)
+            count += len(batch)
+    finally:
+        close()
+
+    return count
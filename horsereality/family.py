@@ -0,0 +1,71 @@
+import json
+import os
+
+from typing import Dict, List, Optional, Set
+
+from .models import Horse
+from .utils import atomic_write
+
+__all__ = (
+    'FamilyCrawlState',
+)
+
+
+def relatives(horse: Horse, *, parents: bool = True, offspring: bool = True) -> List[int]:
+    """The lifenumbers of a horse's parents and/or offspring that appear on
+    its page."""
+    lifenumbers = []
+    if parents:
+        lifenumbers += [lifenumber for lifenumber in (horse.sire_lifenumber, horse.dam_lifenumber) if lifenumber]
+    if offspring:
+        lifenumbers += horse.offspring
+        if horse.foal_lifenumber:
+            lifenumbers.append(horse.foal_lifenumber)
+    return lifenumbers
+
+
+class FamilyCrawlState:
+    """The progress of a family crawl: the depth at which each horse was
+    found, and which of them have been fetched.
+
+    If ``path`` is provided, the state is loaded from it and :meth:`save`
+    writes the state back to it as JSON, so that an interrupted crawl can be
+    resumed by passing the same state to :meth:`Client.crawl_family` again.
+    """
+    def __init__(self, path: Optional[str] = None):
+        self.path: Optional[str] = path
+        self.depths: Dict[int, int] = {}
+        self.done: Set[int] = set()
+
+        if path and os.path.exists(path):
+            with open(path, encoding='utf-8') as fp:
+                saved = json.load(fp)
+            self.depths = {int(lifenumber): depth for lifenumber, depth in saved['depths'].items()}
+            self.done = set(saved['done'])
+
+    def __contains__(self, lifenumber: int) -> bool:
+        return lifenumber in self.depths
+
+    def __len__(self) -> int:
+        return len(self.depths)
+
+    def add(self, lifenumber: int, depth: int) -> bool:
+        """Record a horse found at ``depth``, unless it was already found."""
+        if lifenumber in self.depths:
+            return False
+        self.depths[lifenumber] = depth
+        return True
+
+    def pending(self, depth: int) -> List[int]:
+        """The horses found at ``depth`` that have not been fetched yet."""
+        return [lifenumber for lifenumber, found_at in self.depths.items() if found_at == depth and lifenumber not in self.done]
+
+    def save(self) -> None:
+        if not self.path:
+            raise ValueError('This crawl state has no path to save to.')
+
+        with atomic_write(self.path) as fp:
+            json.dump({
+                'depths': {str(lifenumber): depth for lifenumber, depth in self.depths.items()},
+                'done': sorted(self.done),
+            }, fp)
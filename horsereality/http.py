@@ -1,21 +1,162 @@
+from concurrent.futures import Executor
 import datetime
-from typing import Optional
+import functools
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, Optional, Tuple, Union
 from urllib.parse import urlparse
 import aiohttp
 import asyncio
-from bs4 import BeautifulSoup
 
 from . import __version__
+from .cache import ResponseCache
+from .enums import RequestPriority
+from .instrumentation import Instrumentation
+from .parsing import PARSERS, parse_horse_page, parse_horse_rest, parse_horse_sidebar
+from .ratelimit import RateLimiter
+from .render import DERIVED_LAYER_SIZES, Renderer, layer_dimensions, resize_layer
+from .schedule import RolloverScheduler
+from .store import LayerStore
+from .transport import TransportConfig
+from .utils import layer_path_regex
 from .errors import (
     ClientNotInitialized,
     HTTPException,
     RateLimitExceeded,
     AuthenticationException,
     RolloverRequired,
+    LayerTooLarge,
 )
 
 
+def _retry_after(response: aiohttp.ClientResponse) -> Optional[float]:
+    value = response.headers.get('Retry-After')
+    if value and value.strip().isdigit():
+        return float(value.strip())
+    return None
+
+
+def _check_layer_response(response: '_HeldResponse', url: str) -> None:
+    # Anything but an image (e.g. an error page) is not a layer
+    if response.status != 200 or (response.headers.get('Content-Type') or '').split('/')[0] != 'image':
+        response.release()
+        raise HTTPException(response, f'Unexpected response for layer image: {url}')
+
+
+def _large_layer_path(path: str) -> str:
+    # The path of the large image of a layer that can be resized into the
+    # image at `path`, or `path` itself
+    parts = path.split('/')
+    if layer_path_regex.match(path) and parts[5] in DERIVED_LAYER_SIZES:
+        parts[5] = 'large'
+        return '/'.join(parts)
+    return path
+
+
+class _HeldResponse:
+    # An unread response that keeps the concurrency slot of its request until
+    # it is released, so that bodies which are streamed after `_send`
+    # returns still count towards `max_concurrency`
+    __slots__ = ('response', '_semaphore')
+
+    def __init__(self, response: aiohttp.ClientResponse, semaphore: asyncio.Semaphore):
+        self.response = response
+        self._semaphore: Optional[asyncio.Semaphore] = semaphore
+
+    def __getattr__(self, name: str):
+        return getattr(self.response, name)
+
+    def release(self) -> None:
+        self.response.release()
+        if self._semaphore is not None:
+            semaphore, self._semaphore = self._semaphore, None
+            semaphore.release()
+
+
+async def _iter_layer(
+    source: Union[bytes, memoryview, _HeldResponse],
+    path: str,
+    chunk_size: int,
+    max_size: Optional[int],
+) -> AsyncIterator[Union[bytes, memoryview]]:
+    # Yields a layer image in chunks, either from memory (slicing it without
+    # copying) or from an unread response (which is released afterwards)
+    if isinstance(source, (bytes, memoryview)):
+        view = memoryview(source)
+        if max_size is not None and len(view) > max_size:
+            raise LayerTooLarge(path, max_size)
+        for start in range(0, len(view), chunk_size):
+            yield view[start:start + chunk_size]
+        return
+
+    try:
+        if max_size is not None and (source.content_length or 0) > max_size:
+            raise LayerTooLarge(path, max_size)
+        received = 0
+        async for chunk in source.content.iter_chunked(chunk_size):
+            # Content-Length may be missing or wrong
+            received += len(chunk)
+            if max_size is not None and received > max_size:
+                raise LayerTooLarge(path, max_size)
+            yield chunk
+    finally:
+        # Closes the connection instead if the body was not read to the end
+        source.release()
+
+
+class SingleFlight:
+    """Deduplicates concurrent calls that share a key.
+
+    The first caller for a key starts the call, and every caller with the
+    same key that arrives before it has finished waits for the same result
+    (or exception). Each caller is shielded from the others being cancelled,
+    and the call itself is cancelled once every caller waiting for it has
+    been cancelled.
+    """
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        # The number of callers waiting for each call
+        self._waiters: Dict[asyncio.Future, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def run(self, key: Hashable, func: Callable[..., Awaitable[Any]], *args) -> Any:
+        future = self._calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(func(*args))
+            self._calls[key] = future
+            future.add_done_callback(functools.partial(self._forget, key))
+
+        self._waiters[future] = self._waiters.get(future, 0) + 1
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            if self._waiters[future] == 1 and not future.done():
+                # Nobody is left to use the result. Later callers start over.
+                if self._calls.get(key) is future:
+                    del self._calls[key]
+                future.cancel()
+            raise
+        finally:
+            self._waiters[future] -= 1
+            if not self._waiters[future]:
+                del self._waiters[future]
+
+    def _forget(self, key: Hashable, future: asyncio.Future) -> None:
+        if self._calls.get(key) is future:
+            del self._calls[key]
+        if not future.cancelled():
+            # Mark the exception as retrieved in case every caller was
+            # cancelled before it was raised
+            future.exception()
+
+
 class HTTPClient:
+    # These may be overridden on an instance to point the client elsewhere,
+    # e.g. at the stand-in server used by the benchmarks.
+    www_url = 'https://www.horsereality.com'
+    v2_url = 'https://v2.horsereality.com'
+
     def __init__(
         self,
         remember_cookie_name: str,
@@ -23,7 +164,27 @@ class HTTPClient:
         *,
         auto_rollover: bool = False,
         allow_unverified_client: bool = False,
+        max_concurrency: int = 10,
+        parse_executor: Optional[Executor] = None,
+        parser: str = 'beautifulsoup',
+        cache: Optional[ResponseCache] = None,
+        layer_store: Optional[LayerStore] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        renderer: Optional[Renderer] = None,
+        instrumentation: Optional[Instrumentation] = None,
+        transport: Optional[TransportConfig] = None,
+        scheduled_rollover: bool = False,
+        session_lifetime: Optional[float] = None,
+        derive_layer_sizes: bool = False,
     ):
+        if max_concurrency < 1:
+            raise ValueError('max_concurrency must be at least 1')
+        if parser not in PARSERS:
+            raise ValueError(f'Unknown parser {parser!r}, expected one of {PARSERS!r}')
+        if derive_layer_sizes and cache is None and layer_store is None:
+            # Every derived image would download the large one again
+            raise ValueError('derive_layer_sizes requires a cache or a layer_store to keep the large images in')
+
         self.session: Optional[aiohttp.ClientSession] = None
         self.remember_cookie = {remember_cookie_name: remember_cookie_value}
 
@@ -33,6 +194,60 @@ class HTTPClient:
         self._auto_rollover: bool = auto_rollover
         self._rollover_lock: Optional[asyncio.Lock] = None
 
+        # When enabled, rollovers and logins are done in the background ahead
+        # of the requests that would otherwise run into them. See
+        # `RolloverScheduler`. `initialized_at` is the time of the last login.
+        self.initialized_at: Optional[float] = None
+        self._scheduler: Optional[RolloverScheduler] = (
+            RolloverScheduler(self, session_lifetime=session_lifetime)
+            if scheduled_rollover or session_lifetime is not None else None
+        )
+
+        # Any number of requests may be in flight at once (up to
+        # `max_concurrency`), but rollover and re-authentication pause new
+        # requests until they are done. `_session_generation` is bumped every
+        # time the session is re-authenticated or rolled over so that queued
+        # requests do not repeat work that has just been completed.
+        self.max_concurrency: int = max_concurrency
+        self._request_semaphore: Optional[asyncio.Semaphore] = None
+        self._unpaused: Optional[asyncio.Event] = None
+        self._session_generation: int = 0
+
+        # Outgoing requests are paced by this, if provided. See `RateLimiter`.
+        self.rate_limiter: Optional[RateLimiter] = rate_limiter
+
+        # Pages are parsed in this executor (or the loop's default executor
+        # if it is None) so that parsing never blocks the event loop.
+        self.parse_executor: Optional[Executor] = parse_executor
+        self.parser: str = parser
+
+        # Responses for horse pages and layer images are served from here
+        # when possible. See `ResponseCache`.
+        self.cache: Optional[ResponseCache] = cache
+        self.layer_store: Optional[LayerStore] = layer_store
+        self.renderer: Renderer = renderer if renderer is not None else Renderer()
+
+        # When enabled, only large layer images are downloaded, and the other
+        # sizes are resized from them and kept beside them. See `resize_layer`.
+        # The dimensions to resize to are taken from the first image of each
+        # size that is served for a large image of the same dimensions,
+        # rather than guessed, and kept by (size, large dimensions).
+        self.derive_layer_sizes: bool = derive_layer_sizes
+        self._derived_dimensions: Dict[Tuple[str, Tuple[int, int]], Tuple[int, int]] = {}
+
+        # Sessions come and go with logins, but they all share this
+        # connector so that connections are kept alive in between. It is
+        # created with the first session. See `TransportConfig`.
+        self.transport: TransportConfig = transport if transport is not None else TransportConfig()
+        self._connector: Optional[aiohttp.TCPConnector] = None
+
+        # Timings and counters for each stage of a request. See `Instrumentation`.
+        self.instrumentation: Instrumentation = instrumentation if instrumentation is not None else Instrumentation()
+
+        # Identical plain GETs that are in flight at the same time share one
+        # round trip
+        self._flights = SingleFlight()
+
         # We have to provide a user agent in order to avoid getting blocked from creating sessions.
         # Unfortunately the very nature of this requirement prevents its solution from being very detailed.
         self.user_agent = f'HorseReality/{__version__}'
@@ -43,22 +258,68 @@ class HTTPClient:
         return cookie
 
     async def request(self, method: str, path: str, *, v2: bool = False, **kwargs):
-        url = f'https://{"v2" if v2 else "www"}.horsereality.com{path}'
+        url = f'{self.v2_url if v2 else self.www_url}{path}'
 
         # We want to default to false in case we get a 302
         return_headers = kwargs.pop('return_headers', False)
+        priority = kwargs.pop('priority', RequestPriority.normal)
         kwargs['allow_redirects'] = kwargs.pop('allow_redirects', False)
 
-        async with self._rollover_lock:
-            for tries in range(5):
-                if not self.session or self.session.closed:
-                    if self.last_request_attempt_at and (datetime.datetime.utcnow() - self.last_request_attempt_at).seconds >= 600 and tries == 0:
-                        await self.initialize()
-                        continue
-                    else:
-                        raise ClientNotInitialized()
-
-                response = await self.session.request(method=method, url=url, **kwargs)
+        # A plain GET can be shared between callers, either from the cache or
+        # from an identical request that is already in flight. Anything else
+        # in `kwargs` (e.g. params or headers) could change the response.
+        plain = method == 'GET' and kwargs == {'allow_redirects': False}
+        cacheable = plain and self.cache is not None and self.cache.is_cacheable(path)
+
+        response = self.cache.get(url) if cacheable else None
+        if response is None:
+            if plain:
+                response = await self._flights.run((method, url), self._send, method, path, url, kwargs, cacheable, priority)
+            else:
+                response = await self._send(method, path, url, kwargs, False, priority)
+
+        return {
+            'status': response['status'],
+            'data': response['data'],
+            'headers': (response['headers'] if return_headers else None),
+        }
+
+    async def _send(
+        self,
+        method: str,
+        path: str,
+        url: str,
+        kwargs: Dict[str, Any],
+        cacheable: bool,
+        priority: RequestPriority,
+        raw: bool = False,
+    ) -> Union[Dict[str, Any], _HeldResponse]:
+        # With `raw`, a successful response is returned without reading its
+        # body, and the caller must release it, which also gives back its
+        # concurrency slot
+        self._prepare_concurrency()
+        instrumentation = self.instrumentation
+        for tries in range(5):
+            if tries > 0:
+                instrumentation.emit('retries', method=method, path=path)
+
+            generation = await self._acquire_slot(method, path, priority, tries)
+            recover = None
+            held = False
+            try:
+                sent_at = time.perf_counter()
+                instrumentation.emit('requests', method=method, path=path)
+
+                try:
+                    response = await self.session.request(method=method, url=url, **kwargs)
+                except (asyncio.TimeoutError, aiohttp.ServerDisconnectedError) as exc:
+                    # A hung socket or a kept-alive connection that the server
+                    # has dropped. GETs are safe to send again.
+                    instrumentation.emit('connection_errors', method=method, path=path, error=repr(exc))
+                    if method != 'GET' or tries == 4:
+                        raise
+                    continue
+                instrumentation.observe('network', time.perf_counter() - sent_at, method=method, path=path, status=response.status)
                 location = urlparse(response.headers.get('location')) if response.headers.get('location') else None
 
                 if (location and location.path == '/error-404') or response.status == 404:
@@ -69,57 +330,171 @@ class HTTPClient:
 
                 elif location and location.path.startswith('/daily-rollover') and not path.startswith('/daily-rollover'):
                     # The client needs to complete the daily rollover
-                    if self._auto_rollover:
-                        await self.rollover()
-                        continue
-                    else:
+                    if not self._auto_rollover:
                         raise RolloverRequired(url, response)
+                    # Return the connection to the pool
+                    response.release()
+                    recover = self.rollover
 
                 elif response.status == 302:
                     # We are not authenticated properly
-                    if tries == 5:
+                    if tries == 4:
                         # Give up
                         raise AuthenticationException('Failed to re-authorize 5 times in a row.')
-
-                    await self.initialize()
-                    continue
+                    response.release()
+                    recover = self.initialize
 
                 elif response.status in (403, 429):
+                    instrumentation.emit(f'status_{response.status}', method=method, path=path)
+                    response.release()
+                    if self.rate_limiter is not None:
+                        self.rate_limiter.on_rate_limited(_retry_after(response))
+                        if response.status == 429 and tries < 4:
+                            # The rate limiter has slowed down and paused
+                            # requests, so we can try again once it allows.
+                            continue
+
                     # Horse Reality ended up implementing very strict rate
                     # limiting that isn't so straightforwardly backed off.
                     # Let a different timer handle it.
-                    await self.uninitialize()
+                    await self.uninitialize(f'{response.status} response from {method} {path}')
                     raise RateLimitExceeded(response)
 
-                if (response.headers.get('Content-Type') or '').split('/')[0] == 'image':
-                    data = await response.read()
                 else:
-                    data = await response.text()
+                    if self.rate_limiter is not None:
+                        self.rate_limiter.on_success()
+                    if raw:
+                        held = True
+                        return _HeldResponse(response, self._request_semaphore)
 
-                return {
-                    'status': response.status,
-                    'data': data,
-                    'headers': (response.headers if return_headers else None),
-                }
+                    with instrumentation.time('read', method=method, path=path):
+                        if (response.headers.get('Content-Type') or '').split('/')[0] == 'image':
+                            data = await response.read()
+                        else:
+                            data = await response.text()
 
-        raise Exception('Failed to finalize the request to %s %s after %s tries.' % method, path, tries)
+                    result = {
+                        'status': response.status,
+                        'data': data,
+                        'headers': response.headers,
+                    }
+                    if cacheable and response.status == 200:
+                        self.cache.put(url, path, result)
+                    return result
+
+            finally:
+                if not held:
+                    self._request_semaphore.release()
+
+            # Rollover and re-authentication happen outside of the semaphore
+            # so that they cannot be starved by the requests they are pausing.
+            if recover is not None:
+                await self._run_exclusive(generation, recover)
+
+        raise Exception('Failed to finalize the request to %s %s after %s tries.' % (method, path, tries + 1))
+
+    async def _acquire_slot(self, method: str, path: str, priority: RequestPriority, tries: int) -> int:
+        # Waits until a request may be sent and takes one of the
+        # `max_concurrency` slots for it, which the caller must release.
+        # Returns the session generation that the request is sent with.
+        instrumentation = self.instrumentation
+        logged_in = False
+        while True:
+            # Requests run concurrently, but they must not be sent while the
+            # session is being rolled over or re-authenticated.
+            if not self._unpaused.is_set():
+                with instrumentation.time('pause_wait', method=method, path=path):
+                    await self._unpaused.wait()
+            generation = self._session_generation
+
+            if not self.session or self.session.closed:
+                if self.last_request_attempt_at and self.login_cooldown() == 0 and tries == 0 and not logged_in:
+                    await self._run_exclusive(generation, self.initialize)
+                    logged_in = True
+                    continue
+                else:
+                    raise ClientNotInitialized()
+
+            if self.rate_limiter is not None:
+                with instrumentation.time('rate_limit_wait', method=method, path=path):
+                    await self.rate_limiter.acquire(priority)
+                if not self._unpaused.is_set():
+                    # A rollover or login started while we were waiting
+                    continue
+
+            queued_at = time.perf_counter()
+            await self._request_semaphore.acquire()
+            instrumentation.observe('queue_wait', time.perf_counter() - queued_at, method=method, path=path)
+
+            # A rollover or login may have started, or another request may
+            # have closed the session after being rate limited, while we
+            # were waiting for a slot
+            if self._unpaused.is_set() and self.session and not self.session.closed:
+                return self._session_generation
+            self._request_semaphore.release()
+
+    def _prepare_concurrency(self) -> None:
+        # asyncio primitives are bound to the running loop on some versions,
+        # so they are created lazily instead of in __init__.
+        if self._rollover_lock is None:
+            self._rollover_lock = asyncio.Lock()
+        if self._unpaused is None:
+            self._unpaused = asyncio.Event()
+            self._unpaused.set()
+        if self._request_semaphore is None:
+            self._request_semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    async def _run_exclusive(self, generation: int, func) -> None:
+        """Run ``func`` (a rollover or re-authentication) while no other
+        requests are being sent.
+
+        ``generation`` is the session generation that the caller observed
+        before it decided that ``func`` was necessary. If another request has
+        already completed a rollover or login since then, there is nothing
+        left to do and the caller can simply retry.
+        """
+        self._prepare_concurrency()
+        async with self._rollover_lock:
+            if generation != self._session_generation:
+                return
+
+            self._unpaused.clear()
+            try:
+                await func()
+            finally:
+                self._unpaused.set()
 
     async def initialize(self) -> None:
-        self.session = self.session if self.session and not self.session.closed else aiohttp.ClientSession(headers={'User-Agent': self.user_agent})
-        self._rollover_lock = self._rollover_lock if self._rollover_lock else asyncio.Lock()
+        self.instrumentation.emit('logins')
+        with self.instrumentation.time('initialize'):
+            await self._initialize()
+        if self._scheduler is not None and self.session and not self.session.closed:
+            self._scheduler.start()
+
+    async def _initialize(self) -> None:
+        if not self.session or self.session.closed:
+            if self._connector is None or self._connector.closed:
+                self._connector = self.transport.create_connector()
+            self.session = aiohttp.ClientSession(
+                connector=self._connector,
+                connector_owner=False,
+                timeout=self.transport.timeout,
+                headers={'User-Agent': self.user_agent},
+            )
+        self._prepare_concurrency()
 
         # We need to provide `v1RedirectUrl` with our remembrance cookie so
         # that HR knows to redirect us as though we have just logged in with
         # an email & password.
         get_response = await self.session.request(
-            'GET', 'https://v2.horsereality.com/login',
-            params={'v1RedirectUrl': 'https://www.horsereality.com'},
+            'GET', f'{self.v2_url}/login',
+            params={'v1RedirectUrl': self.www_url},
             cookies=self.cookies,
             allow_redirects=False,
         )
 
         if self._allow_unverified_client and get_response.status != 302:
-            await self.uninitialize()
+            await self.uninitialize(f'{get_response.status} response while logging in')
             return
         elif get_response.status >= 500:
             raise HTTPException(get_response, 'Server error while logging in')
@@ -128,6 +503,7 @@ class HTTPClient:
         elif get_response.status != 302:
             raise AuthenticationException('Failed to log in, likely due to an invalid remembrance cookie name or value.')
 
+        get_response.release()
         self.last_request_attempt_at = None
         if urlparse(get_response.headers['location']).path.startswith('/daily-rollover'):
             # Authentication for v1 was halted by the rollover page
@@ -137,7 +513,7 @@ class HTTPClient:
                 await self.initialize()
                 return
             else:
-                raise RolloverRequired('https://v2.horsereality.com/login', get_response)
+                raise RolloverRequired(f'{self.v2_url}/login', get_response)
 
         # We make yet another request--to the auth token "page"--to finally get our cookie.
         # self.request is not used here because we want to use whatever URL HR throws at us, which _could_ change unexpectedly.
@@ -146,6 +522,7 @@ class HTTPClient:
             get_response.headers['location'],  # https://www.horsereality.com/?v2_auth_token=...
             allow_redirects=False,
         )
+        cookie_response.release()
 
         try:
             # self.cookies['horsereality'] = 
@@ -153,24 +530,184 @@ class HTTPClient:
         except (KeyError, AttributeError):
             raise AuthenticationException()
 
-    async def uninitialize(self):
+        self.initialized_at = time.time()
+        self._session_generation += 1
+
+    async def uninitialize(self, reason: Optional[str] = None):
         self.last_request_attempt_at = datetime.datetime.utcnow()
         await self.session.close()
-        print('Closed session without initializing due to failed login response')
+        self.instrumentation.emit('uninitialized', reason=reason)
+
+    def login_cooldown(self) -> float:
+        """How many seconds are left until a request logs this client in
+        again, after it was uninitialized."""
+        if self.last_request_attempt_at is None:
+            return 0.0
+        elapsed = (datetime.datetime.utcnow() - self.last_request_attempt_at).total_seconds()
+        return max(0.0, 600 - elapsed)
+
+    async def close(self) -> None:
+        """Close the session and its connections."""
+        if self._scheduler is not None:
+            await self._scheduler.stop()
+        if self.session and not self.session.closed:
+            await self.session.close()
+        if self._connector is not None and not self._connector.closed:
+            await self._connector.close()
 
-    async def get_horse(self, lifenumber: int) -> str:
-        data = await self.request('GET', f'/horses/{lifenumber}/')
+    async def get_horse(self, lifenumber: int, *, priority: RequestPriority = RequestPriority.normal) -> str:
+        data = await self.request('GET', f'/horses/{lifenumber}/', priority=priority)
         return data['data']
 
+    async def get_layer(self, path: str) -> Union[bytes, memoryview]:
+        """Read the layer image at ``path``, using the layer store if there is
+        one. Stored images are returned as memory-mapped ``memoryview``\\s."""
+        if self.derive_layer_sizes:
+            large_path = _large_layer_path(path)
+            if large_path != path:
+                return await self._flights.run(('derived_layer', path), self._derive_layer, path, large_path)
+
+        if self.layer_store is not None:
+            view = self.layer_store.get(path)
+            if view is not None:
+                return view
+            # Only store the image once if it is requested several times at once
+            return await self._flights.run(('layer', path), self._fetch_and_store_layer, path)
+
+        return await self._flights.run(('layer', path), self._fetch_layer, path)
+
+    async def stream_layer(
+        self,
+        path: str,
+        *,
+        chunk_size: int = 65536,
+        max_size: Optional[int] = None,
+    ) -> AsyncIterator[Union[bytes, memoryview]]:
+        """Read the layer image at ``path`` in chunks of at most
+        ``chunk_size`` bytes, raising :exc:`LayerTooLarge` if it is larger
+        than ``max_size``. See :meth:`Layer.stream`."""
+        source = await self._open_layer(path)
+        async for chunk in _iter_layer(source, path, chunk_size, max_size):
+            yield chunk
+
+    async def _open_layer(self, path: str) -> Union[bytes, memoryview, _HeldResponse]:
+        # The image itself if it is stored or cached, otherwise the unread
+        # response for it
+        if self.layer_store is not None or (self.derive_layer_sizes and _large_layer_path(path) != path):
+            return await self.get_layer(path)
+
+        url = f'{self.www_url}{path}'
+        if self.cache is not None and self.cache.is_cacheable(path):
+            # Pages cached by request() under the same path are text, and are
+            # fetched again like in _fetch_layer
+            cached = self.cache.get(url)
+            if cached is not None and isinstance(cached['data'], bytes):
+                return cached['data']
+
+        response = await self._send('GET', path, url, {'allow_redirects': False}, False, RequestPriority.normal, raw=True)
+        _check_layer_response(response, url)
+        return response
+
+    async def _fetch_layer(self, path: str) -> bytes:
+        # Only images are returned, so that error pages are never stored or
+        # cached as layers
+        url = f'{self.www_url}{path}'
+        cacheable = self.cache is not None and self.cache.is_cacheable(path)
+        if cacheable:
+            cached = self.cache.get(url)
+            if cached is not None and isinstance(cached['data'], bytes):
+                return cached['data']
+
+        response = await self._send('GET', path, url, {'allow_redirects': False}, False, RequestPriority.normal, raw=True)
+        try:
+            _check_layer_response(response, url)
+            with self.instrumentation.time('read', method='GET', path=path):
+                data = await response.read()
+        finally:
+            response.release()
+
+        if cacheable:
+            self.cache.put(url, path, {'status': response.status, 'data': data, 'headers': response.headers})
+        return data
+
+    async def _fetch_and_store_layer(self, path: str) -> bytes:
+        data = await self._fetch_layer(path)
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, self.layer_store.put, path, data)
+        return data
+
+    async def _derive_layer(self, path: str, large_path: str) -> Union[bytes, memoryview]:
+        url = f'{self.www_url}{path}'
+        if self.layer_store is not None:
+            view = self.layer_store.get(path)
+            if view is not None:
+                return view
+        elif self.cache is not None:
+            cached = self.cache.get(url)
+            if cached is not None and isinstance(cached['data'], bytes):
+                return cached['data']
+
+        # Only images are returned for the large size (see _fetch_layer), so
+        # an error page is never resized and stored as a smaller one
+        large = await self.get_layer(large_path)
+        key = (path.split('/')[5], layer_dimensions(large))
+        loop = asyncio.get_event_loop()
+        dimensions = self._derived_dimensions.get(key)
+        if dimensions is None:
+            # Download the image once to find out what to resize to
+            data = await self._fetch_layer(path)
+            self._derived_dimensions[key] = layer_dimensions(data)
+        else:
+            data = await loop.run_in_executor(None, resize_layer, large, dimensions)
+            self.instrumentation.emit('derived_layers', path=path)
+
+        if self.layer_store is not None:
+            await loop.run_in_executor(None, self.layer_store.put, path, data)
+        elif self.cache is not None:
+            self.cache.put(url, path, {'status': 200, 'data': data, 'headers': {}})
+        return data
+
+    async def parse_horse(self, html_text: str) -> Dict[str, Any]:
+        """Parse a horse page in the parse executor. See :func:`parse_horse_page`."""
+        loop = asyncio.get_event_loop()
+        with self.instrumentation.time('parse', parser=self.parser):
+            return await loop.run_in_executor(
+                self.parse_executor,
+                functools.partial(parse_horse_page, html_text, parser=self.parser),
+            )
+
+    async def parse_horse_sidebar(self, html_text: str):
+        """Parse the sidebar of a horse page in the parse executor. See
+        :func:`parse_horse_sidebar`."""
+        loop = asyncio.get_event_loop()
+        with self.instrumentation.time('parse', parser='streaming'):
+            return await loop.run_in_executor(self.parse_executor, parse_horse_sidebar, html_text)
+
+    async def parse_horse_rest(self, rest) -> Dict[str, Any]:
+        """Parse the rest of a horse page in the parse executor. See
+        :func:`parse_horse_rest`."""
+        loop = asyncio.get_event_loop()
+        with self.instrumentation.time('parse', parser='streaming'):
+            return await loop.run_in_executor(self.parse_executor, parse_horse_rest, rest)
+
     async def rollover(self) -> None:
+        with self.instrumentation.time('rollover'):
+            await self._rollover()
+
+    async def _rollover(self) -> None:
         get_response = await self.session.request(
-            'GET', 'https://v2.horsereality.com/daily-rollover',
-            params={'url': 'https://www.horsereality.com'},
+            'GET', f'{self.v2_url}/daily-rollover',
+            params={'url': self.www_url},
+            # Accounts that do not need to roll over are redirected away
+            allow_redirects=False,
         )
         if get_response.status != 200:
             # Already rolled over
+            get_response.release()
             return
 
+        from bs4 import BeautifulSoup
+
         soup = BeautifulSoup((await get_response.text()), 'html.parser')
         input = soup.find('input', attrs={'name': '_token'})
         try:
@@ -178,11 +715,15 @@ class HTTPClient:
         except:
             raise ValueError('Could not find the required token on the daily rollover page.')
 
-        await self.session.request(
-            'POST', 'https://v2.horsereality.com/daily-rollover',
+        self.instrumentation.emit('rollovers')
+
+        post_response = await self.session.request(
+            'POST', f'{self.v2_url}/daily-rollover',
             headers={'Content-Type': 'application/x-www-form-urlencoded'},
             data={
                 '_token': token,
-                'url': 'https://www.horsereality.com',
+                'url': self.www_url,
             },
         )
+        post_response.release()
+        self._session_generation += 1
@@ -0,0 +1,155 @@
+import hashlib
+import json
+import os
+
+from typing import Any, Dict, Optional, Tuple
+
+from .enums import RequestPriority
+from .models import Horse
+from .parsing import page_sections
+from .utils import atomic_write
+
+__all__ = (
+    'CrawlState',
+    'HorseChange',
+    'refresh_horse',
+)
+
+
+def horse_snapshot(horse: Horse) -> Dict[str, Any]:
+    """What is compared between crawls of a horse: :meth:`Horse.to_dict`
+    and its family, which is read from the same page."""
+    snapshot = horse.to_dict()
+    snapshot['sire_lifenumber'] = horse.sire_lifenumber
+    snapshot['dam_lifenumber'] = horse.dam_lifenumber
+    snapshot['pedigree'] = horse.pedigree
+    snapshot['offspring'] = horse.offspring
+    return snapshot
+
+
+def page_digest(html_text: str) -> str:
+    """Digest a horse page without parsing it. Pages contain values that
+    change on every request (e.g. CSRF tokens), so only the parts of them
+    that horses are read from are digested (see :func:`page_sections`)."""
+    return hashlib.sha1(page_sections(html_text).encode('utf-8')).hexdigest()
+
+
+class CrawlState:
+    """Remembers what was last seen on each horse page during a crawl: a
+    digest of the parts of it that horses are read from, any validators that
+    Horse Reality sent for it, and a snapshot of :meth:`Horse.to_dict` and
+    its family to compare changes against.
+
+    If ``path`` is provided, the state is loaded from it and :meth:`save`
+    writes the state back to it as JSON.
+    """
+    def __init__(self, path: Optional[str] = None):
+        self.path: Optional[str] = path
+        self.entries: Dict[int, Dict[str, Any]] = {}
+
+        if path and os.path.exists(path):
+            with open(path, encoding='utf-8') as fp:
+                self.entries = {int(lifenumber): entry for lifenumber, entry in json.load(fp).items()}
+
+    def __contains__(self, lifenumber: int) -> bool:
+        return lifenumber in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, lifenumber: int) -> Optional[Dict[str, Any]]:
+        return self.entries.get(lifenumber)
+
+    def save(self) -> None:
+        if not self.path:
+            raise ValueError('This crawl state has no path to save to.')
+
+        with atomic_write(self.path) as fp:
+            json.dump({str(lifenumber): entry for lifenumber, entry in self.entries.items()}, fp)
+
+
+class HorseChange:
+    """The outcome of refreshing a horse.
+
+    ``horse`` is only set when the page changed (or is new), and ``changes``
+    maps each key of :meth:`Horse.to_dict` (or ``sire_lifenumber``,
+    ``dam_lifenumber``, ``pedigree`` and ``offspring``) that changed to its
+    ``(old, new)`` values.
+    """
+    __slots__ = ('lifenumber', 'horse', 'changes', 'is_new')
+
+    def __init__(self, lifenumber: int, horse: Optional[Horse], changes: Dict[str, Tuple[Any, Any]], is_new: bool):
+        self.lifenumber: int = lifenumber
+        self.horse: Optional[Horse] = horse
+        self.changes: Dict[str, Tuple[Any, Any]] = changes
+        self.is_new: bool = is_new
+
+    def __repr__(self) -> str:
+        return f'<HorseChange lifenumber={self.lifenumber!r} is_new={self.is_new!r} changed={sorted(self.changes)!r}>'
+
+    @property
+    def changed(self) -> bool:
+        return self.is_new or bool(self.changes)
+
+
+async def refresh_horse(
+    http,
+    lifenumber: int,
+    state: CrawlState,
+    *,
+    priority: RequestPriority = RequestPriority.normal,
+) -> HorseChange:
+    """Fetch a horse again, unless it is known not to have changed since it
+    was last recorded in ``state``, and update ``state``.
+
+    The request is conditional if Horse Reality previously sent an ``ETag``
+    or ``Last-Modified`` header for the page. Otherwise the page is only
+    parsed and compared if the parts of it that horses are read from have
+    changed. Markup changes that do not change the :class:`Horse` are not
+    reported.
+    """
+    entry = state.get(lifenumber)
+
+    headers = {}
+    if entry and entry.get('etag'):
+        headers['If-None-Match'] = entry['etag']
+    if entry and entry.get('last_modified'):
+        headers['If-Modified-Since'] = entry['last_modified']
+
+    response = await http.request('GET', f'/horses/{lifenumber}/', headers=headers, return_headers=True, priority=priority)
+    if response['status'] == 304:
+        return HorseChange(lifenumber, None, {}, False)
+
+    digest = page_digest(response['data'])
+    etag = response['headers'].get('ETag')
+    last_modified = response['headers'].get('Last-Modified')
+
+    if entry and entry['digest'] == digest:
+        entry['etag'] = etag
+        entry['last_modified'] = last_modified
+        return HorseChange(lifenumber, None, {}, False)
+
+    data = await http.parse_horse(response['data'])
+    horse = Horse._from_data(http, data)
+    snapshot = horse_snapshot(horse)
+
+    changes = {}
+    if entry:
+        previous = entry['snapshot']
+        for key, value in snapshot.items():
+            if previous.get(key) != value:
+                changes[key] = (previous.get(key), value)
+        if not changes:
+            # Only the markup changed
+            entry['digest'] = digest
+            entry['etag'] = etag
+            entry['last_modified'] = last_modified
+            return HorseChange(lifenumber, None, {}, False)
+
+    state.entries[lifenumber] = {
+        'digest': digest,
+        'etag': etag,
+        'last_modified': last_modified,
+        'snapshot': snapshot,
+    }
+    return HorseChange(lifenumber, horse, changes, entry is None)
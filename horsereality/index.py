@@ -0,0 +1,176 @@
+from array import array
+from bisect import bisect_left
+import json
+import os
+import sys
+
+from typing import Dict, Iterable, Optional, Tuple, Union
+
+from .enums import LayerType
+from .models import Horse, Layer
+from .utils import atomic_write, import_optional
+
+__all__ = (
+    'LayerIndex',
+)
+
+
+LayerKey = Tuple[LayerType, str, str, str]
+
+
+def _layer_key(layer: Union[Layer, Tuple[Union[LayerType, str], str, str, str]]) -> LayerKey:
+    # Sizes are left out since every size of a layer is the same image
+    if isinstance(layer, Layer):
+        return (layer.type, layer.horse_type, layer.body_part, layer.id)
+    layer_type, horse_type, body_part, id = layer
+    return (LayerType(layer_type), sys.intern(horse_type), sys.intern(body_part), sys.intern(id))
+
+
+def _intersect(smaller: array, larger: array) -> array:
+    numpy = import_optional('numpy')
+    if numpy is not None:
+        # Look every lifenumber up in the larger array at once, without
+        # copying either array
+        needles = numpy.frombuffer(smaller, dtype=numpy.uint64)
+        haystack = numpy.frombuffer(larger, dtype=numpy.uint64)
+        positions = numpy.searchsorted(haystack, needles)
+        positions[positions == len(haystack)] = 0
+        return array('Q', needles[haystack[positions] == needles].tobytes())
+
+    return array('Q', sorted(set(smaller).intersection(larger)))
+
+
+class LayerIndex:
+    """Maps layers to the lifenumbers of the horses that have them, to find
+    horses that share layers without going through every horse.
+
+    Layers are identified by their type, horse type, body part and ID, either
+    as a :class:`Layer` (of any size) or as a tuple of those values, e.g.
+    ``('colours', 'mares', 'body', '7f77...')``. Lifenumbers are kept in
+    sorted ``array('Q')``\\s.
+
+    If ``path`` is provided, the index is loaded from it if it exists, and
+    :meth:`save` writes the index back to it.
+    """
+    def __init__(self, path: Optional[str] = None):
+        self.path: Optional[str] = path
+        self._lifenumbers: Dict[LayerKey, array] = {}
+        # The keys that each horse is indexed under, so that they can be
+        # updated when it is added again. This is rebuilt from
+        # `_lifenumbers` when it is first needed after loading.
+        self._horses: Optional[Dict[int, Tuple[LayerKey, ...]]] = {}
+
+        if path and os.path.exists(path):
+            self._load(path)
+
+    def __len__(self) -> int:
+        """The number of distinct layers in the index."""
+        return len(self._lifenumbers)
+
+    def _forward(self) -> Dict[int, Tuple[LayerKey, ...]]:
+        if self._horses is None:
+            horses: Dict[int, list] = {}
+            for key, lifenumbers in self._lifenumbers.items():
+                for lifenumber in lifenumbers:
+                    horses.setdefault(lifenumber, []).append(key)
+            self._horses = {lifenumber: tuple(keys) for lifenumber, keys in horses.items()}
+        return self._horses
+
+    def add(self, horse: Horse) -> None:
+        """Index the layers of the horse that its page belongs to, replacing
+        whatever it was indexed under before."""
+        self.set(horse.lifenumber, horse.layers)
+
+    def set(self, lifenumber: int, layers: Iterable[Union[Layer, Tuple[Union[LayerType, str], str, str, str]]]) -> None:
+        """Index ``lifenumber`` under ``layers`` only."""
+        horses = self._forward()
+        keys = tuple(dict.fromkeys(_layer_key(layer) for layer in layers))
+        previous = horses.get(lifenumber, ())
+        if previous == keys:
+            return
+
+        for key in previous:
+            if key not in keys:
+                lifenumbers = self._lifenumbers[key]
+                position = bisect_left(lifenumbers, lifenumber)
+                if position < len(lifenumbers) and lifenumbers[position] == lifenumber:
+                    lifenumbers.pop(position)
+                if not lifenumbers:
+                    del self._lifenumbers[key]
+
+        for key in keys:
+            lifenumbers = self._lifenumbers.get(key)
+            if lifenumbers is None:
+                lifenumbers = self._lifenumbers[key] = array('Q')
+            # Horses are usually fetched in order, so this is often an append
+            position = bisect_left(lifenumbers, lifenumber)
+            if position == len(lifenumbers) or lifenumbers[position] != lifenumber:
+                lifenumbers.insert(position, lifenumber)
+
+        if keys:
+            horses[lifenumber] = keys
+        else:
+            horses.pop(lifenumber, None)
+
+    def remove(self, lifenumber: int) -> None:
+        """Remove a horse from the index."""
+        self.set(lifenumber, ())
+
+    def count(self, layer: Union[Layer, Tuple[Union[LayerType, str], str, str, str]]) -> int:
+        """The number of horses that have ``layer``."""
+        lifenumbers = self._lifenumbers.get(_layer_key(layer))
+        return len(lifenumbers) if lifenumbers is not None else 0
+
+    def horses_with(self, *layers: Union[Layer, Tuple[Union[LayerType, str], str, str, str]]) -> array:
+        """The sorted lifenumbers of the horses that have all of ``layers``,
+        as an ``array('Q')``."""
+        if not layers:
+            raise ValueError('At least one layer is required')
+
+        arrays = []
+        for layer in layers:
+            lifenumbers = self._lifenumbers.get(_layer_key(layer))
+            if lifenumbers is None:
+                return array('Q')
+            arrays.append(lifenumbers)
+
+        # Start from the rarest layer so that the result only shrinks
+        arrays.sort(key=len)
+        result = array('Q', arrays[0])
+        for lifenumbers in arrays[1:]:
+            if not result or not lifenumbers:
+                break
+            result = _intersect(result, lifenumbers)
+        return result
+
+    def save(self) -> None:
+        """Write the index to ``path``: a line of JSON listing the layers and
+        how many horses each has, followed by every layer's lifenumbers as
+        little-endian 64-bit integers."""
+        if not self.path:
+            raise ValueError('This layer index has no path to save to.')
+
+        entries = list(self._lifenumbers.items())
+        header = [
+            [layer_type.value, horse_type, body_part, id, len(lifenumbers)]
+            for (layer_type, horse_type, body_part, id), lifenumbers in entries
+        ]
+
+        with atomic_write(self.path, 'wb') as fp:
+            fp.write(json.dumps(header).encode('utf-8') + b'\n')
+            for _, lifenumbers in entries:
+                if sys.byteorder == 'big':
+                    lifenumbers = array('Q', lifenumbers)
+                    lifenumbers.byteswap()
+                lifenumbers.tofile(fp)
+
+    def _load(self, path: str) -> None:
+        with open(path, 'rb') as fp:
+            header = json.loads(fp.readline())
+            for layer_type, horse_type, body_part, id, count in header:
+                lifenumbers = array('Q')
+                lifenumbers.fromfile(fp, count)
+                if sys.byteorder == 'big':
+                    lifenumbers.byteswap()
+                self._lifenumbers[_layer_key((layer_type, horse_type, body_part, id))] = lifenumbers
+        self._horses = None
@@ -0,0 +1,117 @@
+import bisect
+from collections import defaultdict
+from contextlib import contextmanager
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+__all__ = (
+    'Instrumentation',
+    'InstrumentationEvent',
+)
+
+
+# Upper bounds (in seconds) of the timing histogram buckets
+TIMING_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+
+
+class InstrumentationEvent:
+    """Something that happened in the client. ``duration`` is set (in
+    seconds) for timed stages and ``None`` otherwise."""
+    __slots__ = ('name', 'duration', 'fields', 'timestamp')
+
+    def __init__(self, name: str, duration: Optional[float], fields: Dict[str, Any]):
+        self.name: str = name
+        self.duration: Optional[float] = duration
+        self.fields: Dict[str, Any] = fields
+        self.timestamp: float = time.time()
+
+    def __repr__(self) -> str:
+        return f'<InstrumentationEvent name={self.name!r} duration={self.duration!r} fields={self.fields!r}>'
+
+
+class _Timing:
+    __slots__ = ('count', 'total', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.buckets = [0] * len(TIMING_BUCKETS)
+
+    def observe(self, duration: float) -> None:
+        self.count += 1
+        self.total += duration
+        self.buckets[bisect.bisect_left(TIMING_BUCKETS, duration)] += 1
+
+
+class Instrumentation:
+    """Collects counters and stage timings from an :class:`HTTPClient` and
+    passes every event to the listeners added with :meth:`add_listener`.
+
+    Timed stages are ``pause_wait`` (waiting for a rollover or login to
+    finish), ``queue_wait`` (waiting for a concurrency slot),
+    ``rate_limit_wait``, ``network`` (until the response headers arrive),
+    ``read`` (the response body), ``parse``, ``initialize`` and
+    ``rollover``. Counters are ``requests``, ``retries``,
+    ``connection_errors``, ``logins``, ``rollovers``, ``status_403``,
+    ``status_429``, ``uninitialized``, ``scheduled_rollovers``,
+    ``scheduled_logins`` and ``scheduler_errors``.
+    """
+    def __init__(self):
+        self.counters: Dict[str, int] = defaultdict(int)
+        self.timings: Dict[str, _Timing] = defaultdict(_Timing)
+        self._listeners: List[Callable[[InstrumentationEvent], Any]] = []
+
+    def add_listener(self, listener: Callable[[InstrumentationEvent], Any]) -> None:
+        """Call ``listener`` with every :class:`InstrumentationEvent`. It is
+        called synchronously, so it should return quickly."""
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[InstrumentationEvent], Any]) -> None:
+        self._listeners.remove(listener)
+
+    def emit(self, name: str, **fields) -> None:
+        """Count an event and pass it to the listeners."""
+        self.counters[name] += 1
+        if self._listeners:
+            self._dispatch(InstrumentationEvent(name, None, fields))
+
+    def observe(self, stage: str, duration: float, **fields) -> None:
+        """Record the duration of a stage and pass it to the listeners."""
+        self.timings[stage].observe(duration)
+        if self._listeners:
+            self._dispatch(InstrumentationEvent(stage, duration, fields))
+
+    @contextmanager
+    def time(self, stage: str, **fields):
+        """Time the body of a ``with`` block as ``stage``."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start, **fields)
+
+    def _dispatch(self, event: InstrumentationEvent) -> None:
+        for listener in self._listeners:
+            listener(event)
+
+    def to_prometheus(self, prefix: str = 'horsereality') -> str:
+        """Render the counters and timings in the Prometheus text exposition
+        format, e.g. to be served from a ``/metrics`` endpoint."""
+        lines = []
+        if self.counters:
+            lines.append(f'# TYPE {prefix}_events_total counter')
+            for name, value in sorted(self.counters.items()):
+                lines.append(f'{prefix}_events_total{{event="{name}"}} {value}')
+
+        if self.timings:
+            lines.append(f'# TYPE {prefix}_stage_duration_seconds histogram')
+            for stage, timing in sorted(self.timings.items()):
+                cumulative = 0
+                for bound, count in zip(TIMING_BUCKETS, timing.buckets):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'{prefix}_stage_duration_seconds_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+                lines.append(f'{prefix}_stage_duration_seconds_sum{{stage="{stage}"}} {timing.total}')
+                lines.append(f'{prefix}_stage_duration_seconds_count{{stage="{stage}"}} {timing.count}')
+
+        return '\n'.join(lines) + '\n'
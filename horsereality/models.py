@@ -1,12 +1,12 @@
-from bs4 import BeautifulSoup
+import asyncio
 import datetime
-import re
+import sys
 
-from typing import Any, Dict, Optional, List
+from typing import Any, AsyncIterator, Callable, Dict, Optional, List, Union
 
 from .enums import LayerType
-from .errors import PageAlertException
-from .utils import layer_path_regex, get_lifenumber_from_url
+from .render import order_layers
+from .utils import layer_path_regex
 
 __all__ = (
     'Horse',
@@ -14,7 +14,15 @@ __all__ = (
 )
 
 
+def _intern(value: Optional[str]) -> Optional[str]:
+    # Most of the strings on models come from a small set of values (breeds,
+    # body parts, locations...), so they are interned to share one copy.
+    return sys.intern(value) if value is not None else None
+
+
 class Layer:
+    __slots__ = ('_http', 'type', 'horse_type', 'body_part', 'size', 'id')
+
     def __init__(self, *, http, url: str):
         self._http = http
 
@@ -28,10 +36,22 @@ class Layer:
         layer_attrs_list = path.split('/')
 
         self.type: LayerType = getattr(LayerType, layer_attrs_list[2])  # colours, whites
-        self.horse_type: str = layer_attrs_list[3]  # mares, stallions, foals
-        self.body_part: str = layer_attrs_list[4]  # body, mane, tail
-        self.size: str = layer_attrs_list[5]  # small, medium, large
-        self.id: str = layer_attrs_list[6]  # These are not unique
+        self.horse_type: str = sys.intern(layer_attrs_list[3])  # mares, stallions, foals
+        self.body_part: str = sys.intern(layer_attrs_list[4])  # body, mane, tail
+        self.size: str = sys.intern(layer_attrs_list[5])  # small, medium, large
+        self.id: str = sys.intern(layer_attrs_list[6])  # These are not unique
+
+    def _key(self):
+        return (self.type, self.horse_type, self.body_part, self.size, self.id)
+
+    def __eq__(self, other) -> bool:
+        # Layers are equal if they have the same URL path
+        if not isinstance(other, Layer):
+            return NotImplemented
+        return self._key() == other._key()
+
+    def __hash__(self) -> int:
+        return hash(self._key())
 
     def __repr__(self) -> str:
         return f'<Layer type={self.type.value!r} horse_type={self.horse_type!r} body_part={self.body_part!r} size={self.size!r} id={self.id!r}>'
@@ -54,8 +74,37 @@ class Layer:
         return self.url_with_size(self.size)
 
     async def read(self, size: str = None) -> bytes:
-        data = await self._http.request('GET', self.url_path_with_size(size))
-        return data['data']
+        data = await self._http.get_layer(self.url_path_with_size(size))
+        return bytes(data) if isinstance(data, memoryview) else data
+
+    async def read_view(self, size: str = None) -> memoryview:
+        """Like :meth:`read`, but without copying images that are served from
+        the client's layer store."""
+        data = await self._http.get_layer(self.url_path_with_size(size))
+        return data if isinstance(data, memoryview) else memoryview(data)
+
+    def stream(
+        self,
+        size: str = None,
+        *,
+        chunk_size: int = 65536,
+        max_size: Optional[int] = None,
+    ) -> AsyncIterator[Union[bytes, memoryview]]:
+        """Read the image in chunks of at most ``chunk_size`` bytes as it is
+        downloaded, instead of buffering all of it. Raises
+        :exc:`LayerTooLarge` if the image is larger than ``max_size``."""
+        return self._http.stream_layer(self.url_path_with_size(size), chunk_size=chunk_size, max_size=max_size)
+
+    async def read_into(self, buffer, size: str = None, *, chunk_size: int = 65536) -> int:
+        """Read the image into a writable buffer (e.g. a ``bytearray`` or a
+        ``memoryview`` of one) and return the number of bytes read. Raises
+        :exc:`LayerTooLarge` if the image does not fit."""
+        view = memoryview(buffer).cast('B')
+        offset = 0
+        async for chunk in self.stream(size, chunk_size=chunk_size, max_size=len(view)):
+            view[offset:offset + len(chunk)] = chunk
+            offset += len(chunk)
+        return offset
 
     def to_dict(self):
         return {
@@ -68,31 +117,133 @@ class Layer:
 
 
 class Horse:
-    def __init__(self, *, http, data):
+    __slots__ = (
+        '_http',
+        'lifenumber',
+        'name',
+        'sex',
+        'raw_breed',
+        'breed',
+        'age',
+        'birthdate',
+        'height',
+        'location',
+        'owner',
+        'registry',
+        'predicates',
+        '_rest',
+        '_loading',
+        '_on_load',
+        '_looking_at',
+        '_adult_layers',
+        '_foal_layers',
+        '_foal_lifenumber',
+        '_sire_lifenumber',
+        '_dam_lifenumber',
+        '_pedigree',
+        '_offspring',
+    )
+
+    def __init__(self, *, http, data, rest=None):
         self._http = http
 
         self.lifenumber: int = data.get('lifenumber')
         self.name: str = data.get('name')
-        self.sex: str = data.get('sex')
-        self.raw_breed: str = data.get('breed')
-        self.breed: str = self.raw_breed.lower().replace(' ', '_').replace('-', '_')
+        self.sex: str = _intern(data.get('sex'))
+        self.raw_breed: str = _intern(data.get('breed'))
+        self.breed: str = sys.intern(self.raw_breed.lower().replace(' ', '_').replace('-', '_'))
         self.age: str = data.get('age')
         self.birthdate: str = data.get('birthdate')
-        self.height: str = data.get('horse_height')
-        self.location: str = data.get('location')
+        self.height: str = _intern(data.get('horse_height'))
+        self.location: str = _intern(data.get('location'))
         self.owner: str = data.get('owner')
-        self.registry: str = data.get('registry')
+        self.registry: str = _intern(data.get('registry'))
         self.predicates: str = data.get('predicates')
 
-        self.looking_at: Optional[str] = data.get('looking_at')
-        self.multiple_on_page: bool = self.looking_at is not None
+        # Lazy horses only have the sidebar's data to begin with, and keep
+        # the part of the page after it until load() or the first access to
+        # one of the other details reads it
+        self._rest = rest
+        self._loading: Optional[asyncio.Future] = None
+        # Called with the horse once the rest of its page has been read
+        self._on_load: Optional[Callable[['Horse'], None]] = None
+        if rest is None:
+            self._set_details(data)
+
+    def _set_details(self, data: Dict[str, Any]) -> None:
+        self._looking_at: Optional[str] = _intern(data.get('looking_at'))
 
         all_layers = data.get('layers', {})
-        self.adult_layers: List[Layer] = all_layers.get('adult', [])
-        self.foal_layers: List[Layer] = all_layers.get('foal', [])
-        self.foal_lifenumber: Optional[int] = data.get('foal_lifenumber')
+        self._adult_layers: List[Layer] = all_layers.get('adult', [])
+        self._foal_layers: List[Layer] = all_layers.get('foal', [])
+        self._foal_lifenumber: Optional[int] = data.get('foal_lifenumber')
+
+        self._sire_lifenumber: Optional[int] = data.get('sire_lifenumber')
+        self._dam_lifenumber: Optional[int] = data.get('dam_lifenumber')
+        self._pedigree: List[Optional[int]] = data.get('pedigree', [])
+        self._offspring: List[int] = data.get('offspring', [])
+
+    async def load(self) -> None:
+        """Read the rest of a lazy horse's page in the client's parse
+        executor, instead of on the event loop when one of the details that
+        it holds is first accessed. This does nothing if it has already been
+        read."""
+        if self._rest is None:
+            return
+        if self._loading is None:
+            self._loading = asyncio.ensure_future(self._http.parse_horse_rest(self._rest))
+
+        # Shielded since other callers may be waiting for it too
+        data = await asyncio.shield(self._loading)
+        if self._rest is not None:
+            self._set_rest(data)
+
+    def _set_rest(self, data: Dict[str, Any]) -> None:
+        self._set_details(self._hydrate(self._http, data))
+        self._rest = None
+        self._loading = None
+        if self._on_load is not None:
+            on_load, self._on_load = self._on_load, None
+            on_load(self)
+
+    def _detail(name: str, doc: str):
+        attribute = '_' + name
+
+        def get(self):
+            if self._rest is not None:
+                # Also if load() is reading it already, since it cannot be
+                # waited for here
+                from .parsing import parse_horse_rest
+
+                with self._http.instrumentation.time('parse', parser='streaming'):
+                    data = parse_horse_rest(self._rest)
+                self._set_rest(data)
+            return getattr(self, attribute)
+
+        return property(get, doc=doc)
+
+    looking_at = _detail('looking_at', 'Optional[str]: Which horse the page belongs to, if there are two on it.')
+    adult_layers = _detail('adult_layers', 'List[Layer]: The layers of the adult on the page.')
+    foal_layers = _detail('foal_layers', 'List[Layer]: The layers of the foal on the page.')
+    foal_lifenumber = _detail('foal_lifenumber', "Optional[int]: The lifenumber of the dam's foal on the page.")
+    sire_lifenumber = _detail('sire_lifenumber', 'Optional[int]')
+    dam_lifenumber = _detail('dam_lifenumber', 'Optional[int]')
+    pedigree = _detail('pedigree', 'List[Optional[int]]: Every horse in the pedigree, the sire and the dam first.')
+    offspring = _detail('offspring', 'List[int]')
+    del _detail
+
+    @property
+    def multiple_on_page(self) -> bool:
+        return self.looking_at is not None
+
+    @property
+    def is_lazy(self) -> bool:
+        """bool: Whether the details after the sidebar have yet to be read."""
+        return self._rest is not None
 
     def __repr__(self) -> str:
+        if self.is_lazy:
+            return f'<Horse lifenumber={self.lifenumber!r} name={self.name!r} lazy=True>'
         return f'<Horse lifenumber={self.lifenumber!r} name={self.name!r} foal={self.is_foal()!r}>'
 
     @property
@@ -133,78 +284,41 @@ class Horse:
         }
 
     @classmethod
-    async def _from_page(cls, http, html_text):
-        soup = BeautifulSoup(html_text, 'html.parser')
-
-        # Check if this page errored before doing anything (Horse Reality does not return apt status codes)
-        alert_error = soup.select_one('.error')
-        if alert_error and not alert_error.attrs.get('style') == 'display:none;':
-            raise PageAlertException(list(alert_error.stripped_strings)[-1])
-
-        # Sidebar box
-        data = {}
-        try:
-            data['name'] = soup.select_one('.horse_left>h1').string.strip()
-        except:
-            data['name'] = re.sub(r' - Horse Reality$', '', soup.title.string)
-        try:
-            data['sex'] = soup.select_one('img.icon16').attrs['alt'].lower()
-        except:
-            data['sex'] = None
-
-        # Selecting the two "columns" for what we will call the key and value--left and right respectively
-        left_info = soup.select('div.horse_left .infotext .left')
-        right_info = soup.select('div.horse_left .infotext .right')
-        for left, right in zip(left_info, right_info):
-            key = left.string.strip().lower().replace(' ', '_')
-            value = (right.string or '').strip() or None
-            data[key] = value
-
-        data['lifenumber'] = int(data.pop('lifenumber').replace('#', ''))
-
-        # Image layers
-        divs = soup.find_all('div', class_='horse_photo')
+    def _from_data(cls, http, data):
+        """Hydrate a :class:`Horse` from the plain data returned by
+        :func:`horsereality.parsing.parse_horse_page`."""
+        return cls(http=http, data=cls._hydrate(http, data))
+
+    @staticmethod
+    def _hydrate(http, data: Dict[str, Any]) -> Dict[str, Any]:
+        data = dict(data)
         data['layers'] = {
-            'adult': [],
-            'foal': [],
+            key: [Layer(http=http, url=url) for url in urls]
+            for key, urls in data.get('layers', {}).items()
         }
-        if divs:
-            # When there is both a foal and a mare, there are two 'horse_photo'
-            # elements - one with a 'mom' class on the parent 'horse_photocon' element.
-            # We deal with this in the following loop:
-            for div in divs:
-                # Find all the layer URLs (does not get blank.png)
-                urls = re.findall(r'\/upload\/[a-z]+\/[a-z]+\/[a-z]+\/[a-z]+\/[a-z0-9]+\.png', str(div))
-
-                # Converting to Layers dissects the strings for us and makes them easier to deal with
-                div_layers = [Layer(http=http, url=url) for url in urls]
-
-                # We want it to be very unambiguous whether a list of layers is for a foal or an adult
-                if 'foal' in div.parent['class'] or div_layers[0].horse_type == 'foals':
-                    data['layers']['foal'] += div_layers
-                else:
-                    data['layers']['adult'] += div_layers
-
-        # Looking at
-        looking_at_element = soup.select_one('.looking_at>p>strong')
-        if looking_at_element and looking_at_element.string:
-            # Sometimes this class is used for unrelated strings, e.g. "This stallion is standing at stud"
-            # The Realtools extension is guilty of misusing this class too, but we would never encounter that here.
-            if 'looking at' in looking_at_element.string:
-                age = looking_at_element.string.replace('You\'re currently looking at the', '').strip()
-                data['looking_at'] = age
-
-        if data.get('looking_at') == 'dam':
-            # There's a foal on the page, but we aren't looking at it
-            foal_url = divs[1].parent.parent.attrs['href']  # a>div.horse_photocon.foal>div.horse_photo
-            data['foal_lifenumber'] = get_lifenumber_from_url(foal_url)
-
-            # We could search the pedigree for the dam's lifenumber if we are
-            # looking at the foal, but that was deemed more effort than it would
-            # be worth--taking into account the fact that Realtools does not need
-            # that information.
-
-        return cls(http=http, data=data)
+        return data
+
+    @classmethod
+    async def _from_page(cls, http, html_text, *, lazy: bool = False):
+        if lazy:
+            if http.parser != 'streaming':
+                raise ValueError("Lazy horses can only be read with the 'streaming' parser.")
+            data, rest = await http.parse_horse_sidebar(html_text)
+            return cls(http=http, data=data, rest=rest)
+
+        data = await http.parse_horse(html_text)
+        return cls._from_data(http, data)
+
+    async def render(self, size: str = None) -> bytes:
+        """Render this horse's :attr:`layers` into a single PNG.
+
+        The layers are stacked in the order for the horse's breed and sex
+        (see :func:`horsereality.render.order_layers`), and rendered images
+        are cached by the client's :class:`Renderer`. This requires numpy and
+        Pillow.
+        """
+        layers = order_layers(self.layers, self.breed, self.sex)
+        return await self._http.renderer.render(layers, size)
 
     async def fetch_foal(self):
         """Fetch this dam's foal, if it exists on the page."""
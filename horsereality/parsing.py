@@ -0,0 +1,566 @@
+from html.parser import HTMLParser
+import pickle
+import re
+
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from .errors import PageAlertException
+from .utils import get_lifenumber_from_url
+
+__all__ = (
+    'PARSERS',
+    'parse_horse_page',
+    'parse_horse_sidebar',
+    'parse_horse_rest',
+)
+
+
+PARSERS = ('beautifulsoup', 'streaming')
+
+layer_url_regex = re.compile(r'\/upload\/[a-z]+\/[a-z]+\/[a-z]+\/[a-z]+\/[a-z0-9]+\.png')
+
+
+class _PageElements(NamedTuple):
+    # The handful of elements that we actually read from a horse page
+    alert_error: Any
+    name_heading: Any
+    title: Any
+    sex_icon: Any
+    left_info: List[Any]
+    right_info: List[Any]
+    photos: List[Any]
+    looking_at: Any
+    # The link of each pedigree entry (or None for unknown ancestors) and of
+    # each offspring
+    pedigree_hrefs: List[Optional[str]]
+    offspring_hrefs: List[str]
+
+
+def parse_horse_page(html_text: str, parser: str = 'beautifulsoup', *, sidebar_only: bool = False) -> Dict[str, Any]:
+    """Extract the data for a horse from the HTML of its page.
+
+    This function is synchronous and only returns plain data (layers are
+    returned as URL paths rather than :class:`Layer` objects), so it is safe
+    to run in a thread or process pool. Use :meth:`Horse._from_data` to turn
+    the result into a :class:`Horse`.
+
+    ``parser`` selects the extraction engine. ``'beautifulsoup'`` builds a
+    full document tree, whereas ``'streaming'`` makes a single pass over the
+    page and only keeps the elements that are read below. Both produce the
+    same data.
+
+    With ``sidebar_only``, only the details in the sidebar (the name, sex and
+    the info table) are extracted, and the streaming engine stops reading
+    the page after the sidebar.
+    """
+    if parser == 'beautifulsoup':
+        elements = _select_with_beautifulsoup(html_text)
+        layer_urls = lambda div: layer_url_regex.findall(str(div))
+    elif parser == 'streaming':
+        elements = _select_with_streaming(html_text, sidebar_only)
+        layer_urls = _StreamedElement.layer_urls
+    else:
+        raise ValueError(f'Unknown parser {parser!r}, expected one of {PARSERS!r}')
+
+    return _extract(elements, layer_urls, sidebar_only)
+
+
+class _PageRest:
+    # The streaming parser as it was when it stopped after the sidebar, and
+    # the part of the page that it has not read yet. The parser is kept
+    # pickled, so that every read of the rest starts from a copy of it and
+    # reads can happen at the same time in different threads.
+    __slots__ = ('parser_state', 'html_text')
+
+    def __init__(self, parser: '_HorsePageParser', html_text: str):
+        self.parser_state = pickle.dumps(parser, pickle.HIGHEST_PROTOCOL)
+        self.html_text = html_text
+
+
+def parse_horse_sidebar(html_text: str) -> Tuple[Dict[str, Any], _PageRest]:
+    """Extract the details in the sidebar of a horse page with the
+    streaming engine, like ``parse_horse_page(html_text, 'streaming',
+    sidebar_only=True)``.
+
+    This also returns the rest of the page, which only holds the part of the
+    HTML that has not been read yet. Pass it to :func:`parse_horse_rest` to
+    extract everything else.
+    """
+    parser = _HorsePageParser(sidebar_only=True)
+    try:
+        parser.feed(html_text)
+        parser.close()
+        rest = ''
+    except _SidebarParsed:
+        rest = html_text[parser.position_in(html_text):]
+        # Drop what the parser buffered, so that it picks up from the same
+        # place when it is fed the rest
+        parser.reset()
+        parser.sidebar_only = False
+    return _extract(parser.elements(), _StreamedElement.layer_urls, sidebar_only=True), _PageRest(parser, rest)
+
+
+def parse_horse_rest(rest: _PageRest) -> Dict[str, Any]:
+    """Extract all of the data for a horse from the rest of a page returned
+    by :func:`parse_horse_sidebar`."""
+    parser = pickle.loads(rest.parser_state)
+    parser.feed(rest.html_text)
+    parser.close()
+    return _extract(parser.elements(), _StreamedElement.layer_urls)
+
+
+# The elements that `_extract` reads from, by one of their classes. A link
+# right before a photo is part of it, since the foal's lifenumber is read
+# from it.
+_SECTION_CLASSES = ('error', 'horse_left', 'icon16', 'horse_photocon', 'looking_at', 'pedigree', 'offspring')
+_section_start_regex = re.compile(
+    r'<([a-zA-Z][a-zA-Z0-9]*)\b[^>]*?\bclass\s*=\s*["\']?[^"\'>]*?\b(?:' + '|'.join(_SECTION_CLASSES) + r')\b[^>]*>'
+)
+_link_regex = re.compile(r'<a\b[^>]*>\s*', re.I)
+_title_regex = re.compile(r'<title\b[^>]*>.*?</title\s*>', re.I | re.S)
+_tag_regexes: Dict[str, Any] = {}
+
+
+def _element_end(html_text: str, tag: str, start: int) -> int:
+    # The end of the element whose start tag is at `start`, counting the
+    # elements with the same name that are nested in it. Unclosed elements
+    # run to the end of the page.
+    tag = tag.lower()
+    if tag in _VOID_ELEMENTS:
+        return html_text.index('>', start) + 1
+    try:
+        tag_regex = _tag_regexes[tag]
+    except KeyError:
+        tag_regex = _tag_regexes[tag] = re.compile(r'<(/?)' + re.escape(tag) + r'\b[^>]*?(/?)>', re.I)
+
+    depth = 0
+    for match in tag_regex.finditer(html_text, start):
+        if match.group(1):
+            depth -= 1
+        elif not match.group(2):
+            depth += 1
+        if depth <= 0:
+            return match.end()
+    return len(html_text)
+
+
+def page_sections(html_text: str) -> str:
+    """Cut the parts of a horse page that its data is read from out of the
+    page, without parsing it: the title, the error alert, the sidebar, the
+    photos, "looking at", the pedigree and the offspring.
+
+    Anything that changes what :func:`parse_horse_page` returns changes
+    these, but other parts of the page (e.g. CSRF tokens) can change without
+    changing them, which makes them cheap to compare between requests.
+    """
+    sections = []
+    title = _title_regex.search(html_text)
+    if title:
+        sections.append(title.group())
+
+    position = 0
+    while True:
+        match = _section_start_regex.search(html_text, position)
+        if match is None:
+            break
+        start = match.start()
+        link = html_text.rfind('<a', position, start)
+        if link != -1 and _link_regex.fullmatch(html_text, link, start):
+            start = link
+        position = _element_end(html_text, match.group(1), match.start())
+        sections.append(html_text[start:position])
+    return '\n'.join(sections)
+
+
+def _select_with_beautifulsoup(html_text: str) -> _PageElements:
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html_text, 'html.parser')
+    return _PageElements(
+        alert_error=soup.select_one('.error'),
+        name_heading=soup.select_one('.horse_left>h1'),
+        title=soup.title,
+        sex_icon=soup.select_one('img.icon16'),
+        left_info=soup.select('div.horse_left .infotext .left'),
+        right_info=soup.select('div.horse_left .infotext .right'),
+        photos=soup.find_all('div', class_='horse_photo'),
+        looking_at=soup.select_one('.looking_at>p>strong'),
+        pedigree_hrefs=[cell.a.get('href') if cell.a else None for cell in soup.select('.pedigree td.pedigree_horse')],
+        offspring_hrefs=[link['href'] for link in soup.select('.offspring a[href]')],
+    )
+
+
+def _select_with_streaming(html_text: str, sidebar_only: bool = False) -> _PageElements:
+    parser = _HorsePageParser(sidebar_only)
+    try:
+        parser.feed(html_text)
+        parser.close()
+    except _SidebarParsed:
+        pass
+    return parser.elements()
+
+
+def _extract(elements: _PageElements, layer_urls: Callable[[Any], List[str]], sidebar_only: bool = False) -> Dict[str, Any]:
+    # Check if this page errored before doing anything (Horse Reality does not return apt status codes)
+    alert_error = elements.alert_error
+    if alert_error and not alert_error.attrs.get('style') == 'display:none;':
+        raise PageAlertException(list(alert_error.stripped_strings)[-1])
+
+    # Sidebar box
+    data = {}
+    try:
+        data['name'] = elements.name_heading.string.strip()
+    except:
+        try:
+            data['name'] = re.sub(r' - Horse Reality$', '', elements.title.string)
+        except:
+            data['name'] = None
+    try:
+        data['sex'] = elements.sex_icon.attrs['alt'].lower()
+    except:
+        data['sex'] = None
+
+    # The two "columns" are what we will call the key and value--left and right respectively
+    for left, right in zip(elements.left_info, elements.right_info):
+        key = left.string.strip().lower().replace(' ', '_')
+        value = (right.string or '').strip() or None
+        data[key] = value
+
+    data['lifenumber'] = int(data.pop('lifenumber').replace('#', ''))
+    if sidebar_only:
+        return data
+
+    # Image layers
+    divs = elements.photos
+    data['layers'] = {
+        'adult': [],
+        'foal': [],
+    }
+    if divs:
+        # When there is both a foal and a mare, there are two 'horse_photo'
+        # elements - one with a 'mom' class on the parent 'horse_photocon' element.
+        # We deal with this in the following loop:
+        for div in divs:
+            # Find all the layer URLs (does not get blank.png)
+            urls = layer_urls(div)
+
+            # We want it to be very unambiguous whether a list of layers is for a foal or an adult.
+            # The horse type is the third component of the path (/upload/colours/foals/...)
+            if 'foal' in div.parent['class'] or urls[0].split('/')[3] == 'foals':
+                data['layers']['foal'] += urls
+            else:
+                data['layers']['adult'] += urls
+
+    # Looking at
+    looking_at_element = elements.looking_at
+    if looking_at_element and looking_at_element.string:
+        # Sometimes this class is used for unrelated strings, e.g. "This stallion is standing at stud"
+        # The Realtools extension is guilty of misusing this class too, but we would never encounter that here.
+        if 'looking at' in looking_at_element.string:
+            age = looking_at_element.string.replace('You\'re currently looking at the', '').strip()
+            data['looking_at'] = age
+
+    if data.get('looking_at') == 'dam':
+        # There's a foal on the page, but we aren't looking at it
+        foal_url = divs[1].parent.parent.attrs['href']  # a>div.horse_photocon.foal>div.horse_photo
+        data['foal_lifenumber'] = get_lifenumber_from_url(foal_url)
+
+    # Family. The pedigree lists the sire and the dam first, followed by
+    # their ancestors.
+    data['pedigree'] = [get_lifenumber_from_url(href) for href in elements.pedigree_hrefs]
+    data['sire_lifenumber'] = data['pedigree'][0] if len(data['pedigree']) > 0 else None
+    data['dam_lifenumber'] = data['pedigree'][1] if len(data['pedigree']) > 1 else None
+    data['offspring'] = [
+        lifenumber
+        for lifenumber in map(get_lifenumber_from_url, elements.offspring_hrefs)
+        if lifenumber is not None
+    ]
+
+    return data
+
+
+# The streaming engine below mirrors how BeautifulSoup builds its tree with
+# the 'html.parser' backend (void elements, how stray end tags are handled,
+# how strings are joined) so that both engines see the same elements, but it
+# only keeps the subtrees of elements that `_extract` reads.
+
+_VOID_ELEMENTS = frozenset((
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'keygen',
+    'link', 'menuitem', 'meta', 'param', 'source', 'track', 'wbr', 'basefont',
+    'bgsound', 'command', 'frame', 'image', 'isindex', 'nextid', 'spacer',
+))
+_NON_TEXT_CONTAINERS = frozenset(('script', 'style', 'template'))
+
+
+class _Comment(str):
+    # Also used for declarations and processing instructions, which are not
+    # text either
+    pass
+
+
+class _CData(str):
+    # Text, but never joined with the strings around it
+    pass
+
+
+class _SidebarParsed(Exception):
+    # Stops the streaming parser once everything that was asked for is read
+    pass
+
+
+class _StreamedElement:
+    """A stand-in for the parts of a BeautifulSoup ``Tag`` that `_extract`
+    uses. ``children`` is only populated for elements that are kept."""
+    __slots__ = ('name', 'attrs', 'classes', 'parent', 'children', 'in_horse_left', 'in_infotext', 'section')
+
+    def __init__(self, name: str, attrs: Dict[str, Any], parent: Optional['_StreamedElement']):
+        self.name = name
+        self.attrs = attrs
+        self.classes = attrs.get('class', ())
+        self.parent = parent
+        self.children: Optional[list] = None
+
+        # Ancestry flags for `div.horse_left .infotext .left` and friends
+        parent_in_horse_left = parent.in_horse_left if parent else False
+        self.in_horse_left = parent_in_horse_left or (name == 'div' and 'horse_left' in self.classes)
+        self.in_infotext = (parent.in_infotext if parent else False) or (parent_in_horse_left and 'infotext' in self.classes)
+        # Whether this is inside the '.pedigree' or '.offspring' section
+        if 'pedigree' in self.classes:
+            self.section = 'pedigree'
+        elif 'offspring' in self.classes:
+            self.section = 'offspring'
+        else:
+            self.section = parent.section if parent else None
+
+    def __getitem__(self, key: str):
+        return self.attrs[key]
+
+    @property
+    def string(self) -> Optional[str]:
+        element = self
+        while True:
+            if not element.children or len(element.children) != 1:
+                return None
+            child = element.children[0]
+            if isinstance(child, str):
+                return child
+            element = child
+
+    @property
+    def stripped_strings(self):
+        for child in self.children or ():
+            if isinstance(child, _Comment):
+                continue
+            elif isinstance(child, str):
+                if self.name in _NON_TEXT_CONTAINERS:
+                    continue
+                child = child.strip()
+                if child:
+                    yield child
+            else:
+                yield from child.stripped_strings
+
+    def _fragments(self):
+        for value in self.attrs.values():
+            yield ' '.join(value) if isinstance(value, list) else value
+        for child in self.children or ():
+            if isinstance(child, str):
+                yield child
+            else:
+                yield from child._fragments()
+
+    def layer_urls(self) -> List[str]:
+        # Equivalent to searching str(div): URLs cannot span the markup
+        # between attribute values and strings, so each piece is searched
+        # separately in document order.
+        urls = []
+        for fragment in self._fragments():
+            if '/upload/' in fragment:
+                urls += layer_url_regex.findall(fragment)
+        return urls
+
+
+class _HorsePageParser(HTMLParser):
+    def __init__(self, sidebar_only: bool = False):
+        super().__init__(convert_charrefs=True)
+        self.sidebar_only = sidebar_only
+        # Whether the sidebar has been read. The parser then stops before
+        # the next piece of the page, so that nothing after it has been
+        # handled.
+        self.sidebar_parsed = False
+        self.stack: List[_StreamedElement] = []
+        self.open_tags: Dict[str, int] = {}
+        self.data_open = False
+
+        self.alert_error = None
+        self.name_heading = None
+        self.title = None
+        self.sex_icon = None
+        self.left_info = []
+        self.right_info = []
+        self.photos = []
+        self.looking_at = None
+        self.pedigree_hrefs = []
+        self.offspring_hrefs = []
+        # The open pedigree entries that no link has been found in yet, and
+        # their index in pedigree_hrefs. Like `cell.a` in BeautifulSoup, the
+        # first link anywhere in an entry is its link, even if it is in
+        # another entry that is nested in it.
+        self.pedigree_cells: Dict[_StreamedElement, int] = {}
+
+    def elements(self) -> _PageElements:
+        return _PageElements(
+            alert_error=self.alert_error,
+            name_heading=self.name_heading,
+            title=self.title,
+            sex_icon=self.sex_icon,
+            left_info=self.left_info,
+            right_info=self.right_info,
+            photos=self.photos,
+            looking_at=self.looking_at,
+            pedigree_hrefs=self.pedigree_hrefs,
+            offspring_hrefs=self.offspring_hrefs,
+        )
+
+    def position_in(self, html_text: str) -> int:
+        # The position in html_text of the piece that is being handled
+        lineno, column = self.getpos()
+        index = 0
+        for _ in range(lineno - 1):
+            index = html_text.index('\n', index) + 1
+        return index + column
+
+    def _check_sidebar(self):
+        if self.sidebar_only and self.sidebar_parsed:
+            raise _SidebarParsed()
+
+    def handle_starttag(self, tag, attrs):
+        self._check_sidebar()
+        self.data_open = False
+
+        attr_dict = {}
+        for key, value in attrs:
+            if value is None:
+                value = ''
+            if key == 'class':
+                value = value.split()
+            attr_dict[key] = value
+
+        parent = self.stack[-1] if self.stack else None
+        element = _StreamedElement(tag, attr_dict, parent)
+        classes = element.classes
+
+        keep = parent is not None and parent.children is not None
+        if 'error' in classes and self.alert_error is None:
+            self.alert_error = element
+            keep = True
+        if tag == 'h1' and self.name_heading is None and parent and 'horse_left' in parent.classes:
+            self.name_heading = element
+            keep = True
+        if tag == 'title' and self.title is None:
+            self.title = element
+            keep = True
+        if tag == 'img' and self.sex_icon is None and 'icon16' in classes:
+            self.sex_icon = element
+        if parent and parent.in_infotext:
+            if 'left' in classes:
+                self.left_info.append(element)
+                keep = True
+            if 'right' in classes:
+                self.right_info.append(element)
+                keep = True
+        if tag == 'div' and 'horse_photo' in classes:
+            self.photos.append(element)
+            keep = True
+        if (
+            tag == 'strong'
+            and self.looking_at is None
+            and parent and parent.name == 'p'
+            and parent.parent and 'looking_at' in parent.parent.classes
+        ):
+            self.looking_at = element
+            keep = True
+
+        if element.section == 'pedigree':
+            if tag == 'td' and 'pedigree_horse' in classes:
+                self.pedigree_cells[element] = len(self.pedigree_hrefs)
+                self.pedigree_hrefs.append(None)
+            elif tag == 'a' and self.pedigree_cells:
+                for index in self.pedigree_cells.values():
+                    self.pedigree_hrefs[index] = attr_dict.get('href')
+                self.pedigree_cells.clear()
+        elif element.section == 'offspring' and tag == 'a' and 'href' in attr_dict:
+            self.offspring_hrefs.append(attr_dict['href'])
+
+        if keep:
+            element.children = []
+            if parent is not None and parent.children is not None:
+                parent.children.append(element)
+
+        if tag not in _VOID_ELEMENTS:
+            self.stack.append(element)
+            self.open_tags[tag] = self.open_tags.get(tag, 0) + 1
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        self._check_sidebar()
+        self.data_open = False
+        if not self.open_tags.get(tag):
+            # Stray end tags are ignored
+            return
+
+        while self.stack:
+            element = self.stack.pop()
+            self.open_tags[element.name] -= 1
+            if element is self.alert_error:
+                self._check_alert()
+            self.pedigree_cells.pop(element, None)
+            if element.in_horse_left and not (element.parent and element.parent.in_horse_left):
+                self.sidebar_parsed = True
+            if element.name == tag:
+                break
+
+    def handle_data(self, data):
+        self._check_sidebar()
+        parent = self.stack[-1] if self.stack else None
+        if parent is None or parent.children is None:
+            self.data_open = True
+            return
+
+        # BeautifulSoup joins consecutive strings until the next tag or comment
+        if self.data_open and parent.children and type(parent.children[-1]) is str:
+            data = parent.children.pop() + data
+        self.data_open = True
+        parent.children.append(data)
+
+    def handle_comment(self, data):
+        self._add_special(_Comment(data))
+
+    def handle_decl(self, data):
+        self._add_special(_Comment(data))
+
+    def handle_pi(self, data):
+        self._add_special(_Comment(data))
+
+    def unknown_decl(self, data):
+        if data.upper().startswith('CDATA['):
+            self._add_special(_CData(data[len('CDATA['):]))
+        else:
+            self._add_special(_Comment(data))
+
+    def _add_special(self, string):
+        # BeautifulSoup keeps each of these as a separate string
+        self._check_sidebar()
+        self.data_open = False
+        parent = self.stack[-1] if self.stack else None
+        if parent is not None and parent.children is not None:
+            parent.children.append(string)
+
+    def _check_alert(self):
+        # The error alert decides the outcome of the whole page, so there is
+        # no reason to read any further once it is known to be visible.
+        if self.alert_error.attrs.get('style') != 'display:none;':
+            raise PageAlertException(list(self.alert_error.stripped_strings)[-1])
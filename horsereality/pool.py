@@ -0,0 +1,249 @@
+import asyncio
+from concurrent.futures import Executor
+import time
+
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from .cache import ResponseCache
+from .client import Client
+from .enums import RequestPriority
+from .errors import AuthenticationException, ClientNotInitialized, RateLimitExceeded
+from .http import HTTPClient, SingleFlight, _iter_layer
+from .index import LayerIndex
+from .instrumentation import Instrumentation
+from .ratelimit import RateLimiter
+from .render import Renderer
+from .store import LayerStore
+from .transport import TransportConfig
+
+__all__ = (
+    'ClientPool',
+)
+
+
+class _Account:
+    def __init__(self, index: int, http: HTTPClient):
+        self.index = index
+        self.http = http
+        self.in_flight: int = 0
+        self.requests: int = 0
+        self.errors: int = 0
+        self.rate_limited: int = 0
+        self.auth_failures: int = 0
+        self.disabled_until: float = 0.0
+        self.needs_initialize: bool = False
+        self.last_error: Optional[Exception] = None
+        self._initialize_lock: Optional[asyncio.Lock] = None
+
+    def is_available(self, now: float) -> bool:
+        return self.disabled_until <= now
+
+    def disable(self, cooldown: float, error: Exception) -> None:
+        self.last_error = error
+        self.errors += 1
+        if isinstance(error, RateLimitExceeded):
+            self.rate_limited += 1
+        elif isinstance(error, AuthenticationException):
+            self.auth_failures += 1
+        self.disabled_until = time.monotonic() + cooldown
+        self.needs_initialize = True
+
+    async def ensure_initialized(self) -> None:
+        # Accounts coming back from a cooldown log in again before they are
+        # used, but only once no matter how many requests are waiting.
+        if self._initialize_lock is None:
+            self._initialize_lock = asyncio.Lock()
+        async with self._initialize_lock:
+            if self.needs_initialize:
+                await self.http.initialize()
+                self.needs_initialize = False
+
+    def stats(self, now: float) -> Dict[str, Any]:
+        return {
+            'account': self.index,
+            'available': self.is_available(now),
+            'disabled_for': max(0.0, self.disabled_until - now),
+            'in_flight': self.in_flight,
+            'requests': self.requests,
+            'errors': self.errors,
+            'rate_limited': self.rate_limited,
+            'auth_failures': self.auth_failures,
+            'last_error': repr(self.last_error) if self.last_error else None,
+        }
+
+
+class HTTPClientPool:
+    """Spreads requests across the :class:`HTTPClient`\\s of several accounts.
+
+    Each request goes to the available account with the fewest requests in
+    flight. An account that is rate limited or fails to authenticate is taken
+    out of rotation for ``cooldown`` seconds (the request is retried with
+    another account), after which it logs in again before being used.
+    """
+    def __init__(self, clients: List[HTTPClient], *, cooldown: float = 600.0, renderer: Optional[Renderer] = None):
+        if not clients:
+            raise ValueError('At least one account is required')
+
+        self.accounts: List[_Account] = [_Account(index, http) for index, http in enumerate(clients)]
+        self.cooldown: float = cooldown
+        self.renderer: Renderer = renderer if renderer is not None else Renderer()
+        self._flights = SingleFlight()
+
+    @property
+    def parser(self) -> str:
+        return self.accounts[0].http.parser
+
+    @property
+    def instrumentation(self) -> Instrumentation:
+        return self.accounts[0].http.instrumentation
+
+    @property
+    def max_concurrency(self) -> int:
+        return sum(account.http.max_concurrency for account in self.accounts)
+
+    def _choose(self, exclude: Set[_Account]) -> Optional[_Account]:
+        now = time.monotonic()
+        candidates = [
+            account for account in self.accounts
+            if account not in exclude and account.is_available(now)
+        ]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda account: (account.in_flight, account.requests))
+
+    async def _run(self, func: Callable[[HTTPClient], Any]) -> Any:
+        tried: Set[_Account] = set()
+        error: Optional[Exception] = None
+        while True:
+            account = self._choose(tried)
+            if account is None:
+                raise error or ClientNotInitialized()
+            tried.add(account)
+
+            account.in_flight += 1
+            account.requests += 1
+            try:
+                await account.ensure_initialized()
+                return await func(account.http)
+            except (RateLimitExceeded, AuthenticationException, ClientNotInitialized) as exc:
+                account.disable(self.cooldown, exc)
+                error = exc
+            finally:
+                account.in_flight -= 1
+
+    async def request(self, method: str, path: str, **kwargs):
+        return await self._run(lambda http: http.request(method, path, **kwargs))
+
+    async def get_horse(self, lifenumber: int, *, priority: RequestPriority = RequestPriority.normal) -> str:
+        return await self._run(lambda http: http.get_horse(lifenumber, priority=priority))
+
+    async def get_layer(self, path: str):
+        # Coalesced here as well since concurrent reads could otherwise be
+        # routed to different accounts
+        return await self._flights.run(('layer', path), self._run, lambda http: http.get_layer(path))
+
+    async def stream_layer(self, path: str, *, chunk_size: int = 65536, max_size: Optional[int] = None):
+        source = await self._run(lambda http: http._open_layer(path))
+        async for chunk in _iter_layer(source, path, chunk_size, max_size):
+            yield chunk
+
+    async def parse_horse(self, html_text: str) -> Dict[str, Any]:
+        return await self.accounts[0].http.parse_horse(html_text)
+
+    async def parse_horse_sidebar(self, html_text: str):
+        return await self.accounts[0].http.parse_horse_sidebar(html_text)
+
+    async def parse_horse_rest(self, rest) -> Dict[str, Any]:
+        return await self.accounts[0].http.parse_horse_rest(rest)
+
+    async def initialize(self) -> None:
+        """Log in with every account. Accounts that fail are taken out of
+        rotation, and the first error is raised if they all fail."""
+        results = await asyncio.gather(
+            *(account.http.initialize() for account in self.accounts),
+            return_exceptions=True,
+        )
+        errors = []
+        for account, result in zip(self.accounts, results):
+            if isinstance(result, BaseException):
+                if not isinstance(result, Exception):
+                    raise result
+                account.disable(self.cooldown, result)
+                errors.append(result)
+            else:
+                account.needs_initialize = False
+                account.disabled_until = 0.0
+
+        if len(errors) == len(self.accounts):
+            raise errors[0]
+
+    async def rollover(self) -> None:
+        await asyncio.gather(*(account.http.rollover() for account in self.accounts))
+
+    async def close(self) -> None:
+        await asyncio.gather(*(account.http.close() for account in self.accounts))
+
+    def stats(self) -> List[Dict[str, Any]]:
+        now = time.monotonic()
+        return [account.stats(now) for account in self.accounts]
+
+
+class ClientPool(Client):
+    """A :class:`Client` that spreads its requests across several accounts.
+
+    ``credentials`` is an iterable of ``(remember_cookie_name,
+    remember_cookie_value)`` pairs. Every account gets its own session and
+    rollover state; the remaining options are shared between them, except
+    that each account gets its own rate limiter from ``rate_limiter_factory``
+    if one is given.
+    """
+    def __init__(
+        self,
+        credentials: Iterable[Tuple[str, str]],
+        *,
+        auto_rollover: bool = False,
+        allow_unverified_client: bool = False,
+        max_concurrency: int = 10,
+        parse_executor: Optional[Executor] = None,
+        parser: str = 'beautifulsoup',
+        cache: Optional[ResponseCache] = None,
+        layer_store: Optional[LayerStore] = None,
+        rate_limiter_factory: Optional[Callable[[], RateLimiter]] = None,
+        renderer: Optional[Renderer] = None,
+        instrumentation: Optional[Instrumentation] = None,
+        transport: Optional[TransportConfig] = None,
+        scheduled_rollover: bool = False,
+        session_lifetime: Optional[float] = None,
+        layer_index: Optional[LayerIndex] = None,
+        derive_layer_sizes: bool = False,
+        cooldown: float = 600.0,
+    ):
+        # Shared between the accounts so that metrics cover the whole pool
+        instrumentation = instrumentation if instrumentation is not None else Instrumentation()
+        clients = [
+            HTTPClient(
+                remember_cookie_name,
+                remember_cookie_value,
+                auto_rollover=auto_rollover,
+                allow_unverified_client=allow_unverified_client,
+                max_concurrency=max_concurrency,
+                parse_executor=parse_executor,
+                parser=parser,
+                cache=cache,
+                layer_store=layer_store,
+                rate_limiter=rate_limiter_factory() if rate_limiter_factory else None,
+                instrumentation=instrumentation,
+                transport=transport,
+                scheduled_rollover=scheduled_rollover,
+                session_lifetime=session_lifetime,
+                derive_layer_sizes=derive_layer_sizes,
+            )
+            for remember_cookie_name, remember_cookie_value in credentials
+        ]
+        self.http = HTTPClientPool(clients, cooldown=cooldown, renderer=renderer)
+        self._horse_flights = SingleFlight()
+        self.layer_index: Optional[LayerIndex] = layer_index
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """List[Dict[str, Any]]: Per-account counters and availability."""
+        return self.http.stats()
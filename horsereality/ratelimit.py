@@ -0,0 +1,202 @@
+import asyncio
+import heapq
+import itertools
+import multiprocessing
+import time
+
+from typing import List, Optional, Tuple
+
+from .enums import RequestPriority
+
+__all__ = (
+    'RateBudget',
+    'RateLimiter',
+)
+
+
+class RateBudget:
+    """A token bucket that is shared by processes, so that they send at most
+    ``rate`` requests per second between them, with bursts of up to
+    ``burst``.
+
+    Pass it to the :class:`RateLimiter` of the client in each process. It
+    must be created before the processes are started, with the same
+    multiprocessing ``context``, and passed to them when they are started
+    (e.g. in a ``ProcessPoolExecutor``'s ``initargs``).
+    """
+    def __init__(self, rate: float = 2.0, burst: int = 5, *, context=None):
+        if rate <= 0:
+            raise ValueError('rate must be positive')
+        if burst < 1:
+            raise ValueError('burst must be at least 1')
+
+        self.rate: float = rate
+        self.burst: int = burst
+        # tokens, updated at, paused until. time.monotonic() is system-wide,
+        # so these can be compared between processes.
+        self._state = (context or multiprocessing).Array('d', [burst, time.monotonic(), 0.0])
+
+    def take(self) -> float:
+        """Take a token if one is available and return 0, or return how
+        long to wait before trying again."""
+        with self._state.get_lock():
+            tokens, updated_at, paused_until = self._state[:]
+            now = time.monotonic()
+            if paused_until > now:
+                return paused_until - now
+
+            tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+            if tokens >= 1:
+                self._state[:] = [tokens - 1, now, paused_until]
+                return 0.0
+            self._state[:] = [tokens, now, paused_until]
+            return (1 - tokens) / self.rate
+
+    def pause(self, seconds: float) -> None:
+        """Stop every process from sending requests for ``seconds``."""
+        with self._state.get_lock():
+            self._state[0] = min(self._state[0], 0)
+            self._state[2] = max(self._state[2], time.monotonic() + seconds)
+
+
+class RateLimiter:
+    """Paces outgoing requests with a token bucket.
+
+    Up to ``burst`` requests may be sent at once, after which requests are
+    let through at ``rate`` per second. Waiting requests are let through in
+    order of their :class:`RequestPriority`, then in the order they arrived,
+    so interactive lookups are not stuck behind bulk crawls.
+
+    The rate adapts to Horse Reality: every rate limited response divides it
+    by ``decrease_factor`` (down to ``min_rate``) and pauses all requests for
+    the ``Retry-After`` duration or an exponentially growing backoff, and
+    every successful response raises it by ``increase_step`` again (up to
+    the configured ``rate``).
+
+    If a :class:`RateBudget` is provided as ``budget``, requests also wait
+    for a token from it, and rate limited responses pause every process
+    that shares it.
+    """
+    def __init__(
+        self,
+        rate: float = 2.0,
+        burst: int = 5,
+        *,
+        min_rate: float = 0.1,
+        decrease_factor: float = 2.0,
+        increase_step: Optional[float] = None,
+        initial_backoff: float = 1.0,
+        max_backoff: float = 60.0,
+        budget: Optional[RateBudget] = None,
+    ):
+        if rate <= 0 or min_rate <= 0:
+            raise ValueError('rate and min_rate must be positive')
+        if burst < 1:
+            raise ValueError('burst must be at least 1')
+        if decrease_factor <= 1:
+            raise ValueError('decrease_factor must be greater than 1')
+
+        self.max_rate: float = rate
+        self.rate: float = rate
+        self.burst: int = burst
+        self.min_rate: float = min(min_rate, rate)
+        self.decrease_factor: float = decrease_factor
+        self.increase_step: float = increase_step if increase_step is not None else rate / 20
+        self.initial_backoff: float = initial_backoff
+        self.max_backoff: float = max_backoff
+        self.budget: Optional[RateBudget] = budget
+
+        self._tokens: float = burst
+        self._updated_at: float = time.monotonic()
+        self._paused_until: float = 0.0
+        self._backoff: float = initial_backoff
+
+        # (priority, arrival, future)
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._arrivals = itertools.count()
+        self._wakeup: Optional[asyncio.TimerHandle] = None
+
+        self.rate_limited: int = 0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def _delay(self) -> float:
+        # How long until the next request may be let through
+        now = time.monotonic()
+        if self._paused_until > now:
+            return self._paused_until - now
+        if self._tokens >= 1:
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+    async def acquire(self, priority: RequestPriority = RequestPriority.normal) -> None:
+        """Wait until a request with ``priority`` may be sent."""
+        self._refill()
+        if not self._waiters and self._delay() == 0:
+            self._tokens -= 1
+        else:
+            loop = asyncio.get_event_loop()
+            future = loop.create_future()
+            heapq.heappush(self._waiters, (int(priority), next(self._arrivals), future))
+            self._schedule()
+            await future
+
+        if self.budget is not None:
+            delay = self.budget.take()
+            while delay:
+                await asyncio.sleep(delay)
+                delay = self.budget.take()
+
+    def _schedule(self) -> None:
+        if self._wakeup is not None or not self._waiters:
+            return
+        loop = asyncio.get_event_loop()
+        self._wakeup = loop.call_later(self._delay(), self._release)
+
+    def _release(self) -> None:
+        self._wakeup = None
+        self._refill()
+        while self._waiters and self._delay() == 0:
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                # The waiter was cancelled
+                continue
+            self._tokens -= 1
+            future.set_result(None)
+        self._schedule()
+
+    def _reschedule(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.cancel()
+            self._wakeup = None
+        self._schedule()
+
+    def on_success(self) -> None:
+        """Report that a request went through without being rate limited."""
+        self._backoff = self.initial_backoff
+        if self.rate < self.max_rate:
+            self._refill()
+            self.rate = min(self.max_rate, self.rate + self.increase_step)
+
+    def on_rate_limited(self, retry_after: Optional[float] = None) -> float:
+        """Report that a request was rate limited. Returns the number of
+        seconds that requests are paused for."""
+        self.rate_limited += 1
+        self._refill()
+        self.rate = max(self.min_rate, self.rate / self.decrease_factor)
+        self._tokens = min(self._tokens, 0)
+
+        if retry_after is not None:
+            pause = retry_after
+        else:
+            pause = self._backoff
+            self._backoff = min(self.max_backoff, self._backoff * 2)
+        self._paused_until = max(self._paused_until, time.monotonic() + pause)
+        if self.budget is not None:
+            self.budget.pause(pause)
+
+        self._reschedule()
+        return pause
@@ -0,0 +1,194 @@
+import asyncio
+from collections import OrderedDict
+import io
+
+from typing import TYPE_CHECKING, List, Optional, Sequence, Tuple
+
+from .enums import BreedOrders, LayerType
+from .utils import import_optional
+
+if TYPE_CHECKING:
+    from .models import Layer
+
+__all__ = (
+    'Renderer',
+    'order_layers',
+)
+
+
+def order_layers(layers: Sequence['Layer'], breed: str, sex: Optional[str]) -> List['Layer']:
+    """Sort ``layers`` into the order that they should be drawn in, from the
+    bottom up.
+
+    Body parts are drawn in the order given by :class:`BreedOrders` for the
+    breed and sex (geldings use the stallion order), and within each body
+    part white markings are drawn over the colours. Layers of breeds without
+    a known order keep the order that they appeared in on the page.
+    """
+    try:
+        part_order = BreedOrders[breed].value['mare' if sex == 'mare' else 'stallion']
+    except KeyError:
+        return list(layers)
+
+    def key(layer):
+        try:
+            part = part_order.index(layer.body_part)
+        except ValueError:
+            part = len(part_order)
+        return (part, layer.type is LayerType.whites)
+
+    # sorted() is stable, so layers that compare equal keep their page order
+    return sorted(layers, key=key)
+
+
+# The layer image sizes that a client can derive from the large image
+# instead of downloading them. Their dimensions are taken from an image of
+# that size that Horse Reality has served.
+DERIVED_LAYER_SIZES = ('medium', 'small')
+
+
+def _box_resize(numpy, pixels, new_size: int, axis: int):
+    # Each output pixel is the average of the input pixels that it covers,
+    # weighted by how much of them it covers. That is the difference of the
+    # running total at its two edges, divided by its width.
+    size = pixels.shape[axis]
+    if size % new_size == 0:
+        # Whole blocks of pixels, e.g. for halving, which is much faster
+        shape = list(pixels.shape)
+        shape[axis:axis + 1] = [new_size, size // new_size]
+        return pixels.reshape(shape).mean(axis=axis + 1, dtype=numpy.float32)
+
+    scale = size / new_size
+    totals = numpy.cumsum(pixels, axis=axis, dtype=numpy.float64)
+    totals = numpy.concatenate([numpy.zeros_like(totals.take([0], axis=axis)), totals], axis=axis)
+
+    edges = numpy.arange(new_size + 1) * scale
+    whole = numpy.minimum(edges.astype(numpy.intp), size - 1)
+    shape = [1] * pixels.ndim
+    shape[axis] = -1
+    fraction = (edges - whole).reshape(shape)
+    # The running total at fractional positions, between whole pixels
+    at_edges = totals.take(whole, axis=axis) * (1 - fraction) + totals.take(whole + 1, axis=axis) * fraction
+    return (numpy.diff(at_edges, axis=axis) / scale).astype(numpy.float32)
+
+
+def layer_dimensions(data: bytes) -> Tuple[int, int]:
+    """The ``(width, height)`` of a PNG layer image, read from its header."""
+    Image = import_optional('PIL.Image')
+    if Image is None:
+        raise RuntimeError('Resizing layers requires numpy and Pillow to be installed.')
+    return Image.open(io.BytesIO(data)).size
+
+
+def resize_layer(data: bytes, dimensions: Tuple[int, int]) -> bytes:
+    """Scale a PNG layer image down to ``dimensions`` (a ``(width,
+    height)`` tuple) with a box filter and return the result as a PNG."""
+    numpy = import_optional('numpy')
+    Image = import_optional('PIL.Image')
+    if numpy is None or Image is None:
+        raise RuntimeError('Resizing layers requires numpy and Pillow to be installed.')
+
+    pixels = numpy.asarray(Image.open(io.BytesIO(data)).convert('RGBA'), dtype=numpy.float32)
+    height, width = pixels.shape[:2]
+    new_width, new_height = dimensions
+    if not (0 < new_width <= width and 0 < new_height <= height):
+        raise ValueError(f'Layers can only be scaled down ({width}x{height} to {new_width}x{new_height}).')
+
+    # Average with premultiplied alpha, so that the colour of transparent
+    # pixels does not bleed into the edges of the layer
+    pixels[..., :3] *= pixels[..., 3:] / 255.0
+    pixels = _box_resize(numpy, _box_resize(numpy, pixels, new_height, 0), new_width, 1)
+
+    alpha = pixels[..., 3:]
+    numpy.divide(pixels[..., :3] * 255.0, alpha, out=pixels[..., :3], where=alpha > 0)
+    pixels += 0.5
+    numpy.clip(pixels, 0, 255, out=pixels)
+
+    output = io.BytesIO()
+    Image.fromarray(pixels.astype(numpy.uint8), 'RGBA').save(output, format='PNG')
+    return output.getvalue()
+
+
+def composite(images: Sequence[bytes]) -> bytes:
+    """Alpha-composite PNG ``images`` over each other (the first image is at
+    the bottom) and return the result as a PNG."""
+    numpy = import_optional('numpy')
+    Image = import_optional('PIL.Image')
+    if numpy is None or Image is None:
+        raise RuntimeError('Rendering requires numpy and Pillow to be installed.')
+    if not images:
+        raise ValueError('There are no layers to render.')
+
+    result = None
+    for data in images:
+        pixels = numpy.asarray(Image.open(io.BytesIO(data)).convert('RGBA'), dtype=numpy.float32)
+        pixels /= 255.0
+        # Blending is done with premultiplied alpha, where "source over
+        # destination" is the same operation for every channel
+        pixels[..., :3] *= pixels[..., 3:]
+
+        if result is None:
+            result = pixels
+            continue
+        if pixels.shape != result.shape:
+            raise ValueError(f'Layer dimensions do not match ({pixels.shape[1]}x{pixels.shape[0]} and {result.shape[1]}x{result.shape[0]}).')
+
+        result *= 1.0 - pixels[..., 3:]
+        result += pixels
+
+    alpha = result[..., 3:]
+    numpy.divide(result[..., :3], alpha, out=result[..., :3], where=alpha > 0)
+    result *= 255.0
+    result += 0.5
+    numpy.clip(result, 0, 255, out=result)
+
+    output = io.BytesIO()
+    Image.fromarray(result.astype(numpy.uint8), 'RGBA').save(output, format='PNG')
+    return output.getvalue()
+
+
+class Renderer:
+    """Renders horses from their layers and keeps the ``max_entries`` most
+    recently rendered images, keyed by the layers that they are made of."""
+    def __init__(self, *, max_entries: int = 256):
+        self.max_entries: int = max_entries
+        self._rendered: 'OrderedDict[Tuple[str, ...], bytes]' = OrderedDict()
+        self._pending = {}
+
+        self.hits: int = 0
+        self.misses: int = 0
+
+    async def render(self, layers: Sequence['Layer'], size: Optional[str] = None) -> bytes:
+        """Fetch ``layers`` concurrently and composite them in the order
+        given. Returns a PNG."""
+        key = tuple(layer.url_path_with_size(size) for layer in layers)
+        rendered = self._rendered.get(key)
+        if rendered is not None:
+            self._rendered.move_to_end(key)
+            self.hits += 1
+            return rendered
+
+        # Identical renders that are requested at the same time are only
+        # done once
+        future = self._pending.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._render(key, layers, size))
+            self._pending[key] = future
+            future.add_done_callback(lambda _: self._pending.pop(key, None))
+        return await asyncio.shield(future)
+
+    async def _render(self, key: Tuple[str, ...], layers: Sequence['Layer'], size: Optional[str]) -> bytes:
+        self.misses += 1
+        images = await asyncio.gather(*(layer.read(size) for layer in layers))
+
+        loop = asyncio.get_event_loop()
+        rendered = await loop.run_in_executor(None, composite, images)
+
+        if self.max_entries > 0:
+            self._rendered[key] = rendered
+            while len(self._rendered) > self.max_entries:
+                self._rendered.popitem(last=False)
+        return rendered
+
+    def clear(self) -> None:
+        self._rendered.clear()
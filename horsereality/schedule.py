@@ -0,0 +1,164 @@
+import asyncio
+import datetime
+import time
+from typing import Optional
+
+import aiohttp
+
+from .errors import HorseRealityException, RolloverRequired
+
+__all__ = (
+    'next_rollover',
+)
+
+
+def _last_sunday(year: int, month: int) -> datetime.date:
+    last_day = datetime.date(year + month // 12, month % 12 + 1, 1) - datetime.timedelta(days=1)
+    return last_day - datetime.timedelta(days=(last_day.weekday() + 1) % 7)
+
+
+def _amsterdam_offset(moment: datetime.datetime) -> datetime.timedelta:
+    # The Netherlands follows the EU rule: summer time (UTC+2) starts on the
+    # last Sunday of March and ends on the last Sunday of October, both at
+    # 1:00 UTC. This is done by hand so that no tz database is needed.
+    year = moment.year
+    starts = datetime.datetime.combine(_last_sunday(year, 3), datetime.time(1, tzinfo=datetime.timezone.utc))
+    ends = datetime.datetime.combine(_last_sunday(year, 10), datetime.time(1, tzinfo=datetime.timezone.utc))
+    if starts <= moment < ends:
+        return datetime.timedelta(hours=2)
+    return datetime.timedelta(hours=1)
+
+
+def next_rollover(now: Optional[datetime.datetime] = None) -> datetime.datetime:
+    """:class:`datetime.datetime`: The next midnight in the Netherlands (when
+    Horse Reality requires accounts to roll over) after ``now``, as an aware
+    UTC datetime. ``now`` defaults to the current time and is assumed to be
+    in UTC if it is naive."""
+    if now is None:
+        now = datetime.datetime.now(datetime.timezone.utc)
+    elif now.tzinfo is None:
+        now = now.replace(tzinfo=datetime.timezone.utc)
+    else:
+        now = now.astimezone(datetime.timezone.utc)
+
+    local_date = (now + _amsterdam_offset(now)).date()
+    midnight = datetime.datetime.combine(local_date + datetime.timedelta(days=1), datetime.time(tzinfo=datetime.timezone.utc))
+    # Midnight is 22:00 or 23:00 UTC, and DST only changes at 1:00 UTC, so
+    # the offset at 22:00 UTC is the one that applies
+    return midnight - _amsterdam_offset(midnight - datetime.timedelta(hours=2))
+
+
+class RolloverScheduler:
+    """Rolls an :class:`HTTPClient` over shortly after midnight and logs it in
+    again before its session expires, so that requests do not have to wait
+    for either.
+
+    Both are done with requests paused, like a rollover or login that a
+    request runs into. If one fails, it is tried again after
+    ``retry_delay`` seconds; requests that need it in the meantime will
+    still do it themselves.
+    """
+    def __init__(
+        self,
+        http,
+        *,
+        rollover_delay: float = 5.0,
+        session_lifetime: Optional[float] = None,
+        refresh_margin: float = 60.0,
+        retry_delay: float = 30.0,
+    ):
+        self.http = http
+        # Seconds after midnight to roll over at, to allow for clock skew
+        self.rollover_delay: float = rollover_delay
+        # How long a login lasts, or None to never log in again ahead of time
+        self.session_lifetime: Optional[float] = session_lifetime
+        self.refresh_margin: float = refresh_margin
+        self.retry_delay: float = retry_delay
+
+        self._task: Optional[asyncio.Future] = None
+        # A failed login is not retried before this time
+        self._retry_login_at: float = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        if not self.running:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _login(self) -> None:
+        try:
+            await self.http.initialize()
+        except RolloverRequired:
+            # The login was held up by the rollover page, and the client
+            # does not roll over by itself
+            await self.http.rollover()
+            await self.http.initialize()
+
+    def _refresh_at(self) -> float:
+        if self.session_lifetime is None or self.http.initialized_at is None:
+            return float('inf')
+        return max(self.http.initialized_at + self.session_lifetime - self.refresh_margin, self._retry_login_at)
+
+    async def _sleep_until(self, timestamp: float) -> None:
+        # Sleep in short steps against the wall clock so that the deadline
+        # is not missed if the clock is adjusted or the machine is suspended
+        while True:
+            remaining = timestamp - time.time()
+            if remaining <= 0:
+                return
+            await asyncio.sleep(min(remaining, 60.0))
+
+    async def _run(self) -> None:
+        rollover_at = next_rollover().timestamp() + self.rollover_delay
+        rollover_failures = 0
+        while True:
+            refresh_at = self._refresh_at()
+            rollover_due = rollover_at <= refresh_at
+            await self._sleep_until(rollover_at if rollover_due else refresh_at)
+            if not rollover_due and self._refresh_at() > time.time():
+                # Something else logged in while we were sleeping
+                continue
+
+            http = self.http
+            if not http.session or http.session.closed:
+                # The client was uninitialized; requests will log in again
+                # when they are allowed to
+                if rollover_due:
+                    rollover_at = next_rollover().timestamp() + self.rollover_delay
+                else:
+                    self._retry_login_at = time.time() + self.retry_delay
+                continue
+
+            name = 'scheduled_rollovers' if rollover_due else 'scheduled_logins'
+            try:
+                await http._run_exclusive(http._session_generation, http.rollover if rollover_due else self._login)
+            except (HorseRealityException, aiohttp.ClientError, asyncio.TimeoutError, ValueError) as exc:
+                http.instrumentation.emit('scheduler_errors', task=name, error=repr(exc))
+                if rollover_due:
+                    rollover_failures += 1
+                    if rollover_failures < 3:
+                        rollover_at = time.time() + self.retry_delay
+                    else:
+                        # Leave it to the requests that run into it
+                        rollover_failures = 0
+                        rollover_at = next_rollover().timestamp() + self.rollover_delay
+                else:
+                    self._retry_login_at = time.time() + self.retry_delay
+                continue
+
+            http.instrumentation.emit(name)
+            if rollover_due:
+                rollover_failures = 0
+                rollover_at = next_rollover().timestamp() + self.rollover_delay
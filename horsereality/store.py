@@ -0,0 +1,154 @@
+from collections import OrderedDict
+import mmap
+import os
+import threading
+
+from typing import Optional
+
+from .utils import atomic_write, layer_path_regex
+
+__all__ = (
+    'LayerStore',
+)
+
+
+class LayerStore:
+    """A persistent store of layer images in a local directory.
+
+    Images are keyed by their URL path (see :meth:`Layer.url_path_with_size`)
+    and mirrored under ``directory`` with the same layout, so the store
+    survives restarts. Hits are served as read-only ``memoryview``\\s of
+    memory-mapped files, which avoids copying the image until it is actually
+    needed. Once the stored images exceed ``max_bytes``, the least recently
+    used ones are deleted.
+    """
+    def __init__(self, directory: str, *, max_bytes: int = 1024 * 1024 * 1024):
+        if max_bytes < 1:
+            raise ValueError('max_bytes must be at least 1')
+
+        self.directory: str = os.path.abspath(directory)
+        self.max_bytes: int = max_bytes
+        self.size: int = 0
+
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+
+        # url_path: size, from least to most recently used. Images may be
+        # written from an executor while they are read on the loop.
+        self._files: 'OrderedDict[str, int]' = OrderedDict()
+        self._lock = threading.Lock()
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._load()
+
+    def _load(self) -> None:
+        found = []
+        for root, _, filenames in os.walk(self.directory):
+            for filename in filenames:
+                if not filename.endswith('.png'):
+                    # Leftover temporary files from an interrupted write
+                    continue
+                full_path = os.path.join(root, filename)
+                url_path = '/' + os.path.relpath(full_path, self.directory).replace(os.sep, '/')
+                if not self._is_valid_key(url_path):
+                    continue
+                stat = os.stat(full_path)
+                found.append((stat.st_mtime, url_path, stat.st_size))
+
+        for _, url_path, size in sorted(found):
+            self._files[url_path] = size
+            self.size += size
+
+        with self._lock:
+            self._evict()
+
+    @staticmethod
+    def _is_valid_key(url_path: str) -> bool:
+        match = layer_path_regex.match(url_path)
+        return bool(match) and match.group(1) + '.png' == url_path
+
+    def _file_path(self, url_path: str) -> str:
+        if not self._is_valid_key(url_path):
+            raise ValueError(f'Invalid layer path {url_path!r}')
+        return os.path.join(self.directory, *url_path.lstrip('/').split('/'))
+
+    def __contains__(self, url_path: str) -> bool:
+        return url_path in self._files
+
+    def __len__(self) -> int:
+        return len(self._files)
+
+    def get(self, url_path: str) -> Optional[memoryview]:
+        """Return a read-only view of the stored image at ``url_path``, or
+        ``None`` if it is not stored."""
+        file_path = self._file_path(url_path)
+        with self._lock:
+            if url_path not in self._files:
+                self.misses += 1
+                return None
+            self._files.move_to_end(url_path)
+
+        try:
+            with open(file_path, 'rb') as fp:
+                try:
+                    mapped = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+                except ValueError:
+                    # Empty files cannot be mapped
+                    mapped = b''
+            # Keep the recency order across restarts
+            os.utime(file_path)
+        except FileNotFoundError:
+            # Deleted from outside of the store
+            with self._lock:
+                size = self._files.pop(url_path, None)
+                if size is not None:
+                    self.size -= size
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return memoryview(mapped)
+
+    def put(self, url_path: str, data: bytes) -> None:
+        """Store ``data`` as the image at ``url_path``. This writes to disk,
+        so it should be run in an executor from async code."""
+        file_path = self._file_path(url_path)
+        size = len(data)
+        if size > self.max_bytes:
+            return
+
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        # Readers never see a partially written image
+        with atomic_write(file_path, 'wb') as fp:
+            fp.write(data)
+
+        with self._lock:
+            old_size = self._files.pop(url_path, None)
+            if old_size is not None:
+                self.size -= old_size
+            self._files[url_path] = size
+            self.size += size
+            self._evict()
+
+    def _evict(self) -> None:
+        while self.size > self.max_bytes and self._files:
+            url_path, size = self._files.popitem(last=False)
+            self.size -= size
+            self.evictions += 1
+            try:
+                os.remove(self._file_path(url_path))
+            except OSError:
+                # Already gone, or still mapped on platforms that do not
+                # allow that; it will be picked up again on the next load.
+                pass
+
+    def stats(self):
+        """Return the store's counters as a dict."""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self._files),
+            'size': self.size,
+        }
@@ -0,0 +1,62 @@
+from typing import Optional
+
+import aiohttp
+
+__all__ = (
+    'TransportConfig',
+)
+
+
+class TransportConfig:
+    """Connection pool and timeout settings for an :class:`HTTPClient`.
+
+    Every client keeps a single connection pool for both Horse Reality hosts,
+    which outlives its session so that connections are kept alive across
+    logins and rollovers.
+    """
+    def __init__(
+        self,
+        *,
+        limit: int = 100,
+        limit_per_host: int = 0,
+        dns_ttl: Optional[int] = 300,
+        keepalive_timeout: float = 30.0,
+        total_timeout: Optional[float] = 60.0,
+        connect_timeout: Optional[float] = 10.0,
+        read_timeout: Optional[float] = 30.0,
+    ):
+        if limit < 0 or limit_per_host < 0:
+            raise ValueError('Connection limits cannot be negative')
+
+        # 0 means no limit, as with aiohttp
+        self.limit: int = limit
+        self.limit_per_host: int = limit_per_host
+        # How long resolved addresses are cached for, or None to cache them forever
+        self.dns_ttl: Optional[int] = dns_ttl
+        # How long idle connections are kept open for reuse
+        self.keepalive_timeout: float = keepalive_timeout
+
+        # Timeouts for a whole request, for acquiring a connection (including
+        # opening it), and for each read from the socket
+        self.total_timeout: Optional[float] = total_timeout
+        self.connect_timeout: Optional[float] = connect_timeout
+        self.read_timeout: Optional[float] = read_timeout
+
+    @property
+    def timeout(self) -> aiohttp.ClientTimeout:
+        return aiohttp.ClientTimeout(
+            total=self.total_timeout,
+            connect=self.connect_timeout,
+            sock_read=self.read_timeout,
+        )
+
+    def create_connector(self) -> aiohttp.TCPConnector:
+        """Create a connector with these settings. This must be called with
+        the event loop running."""
+        return aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            use_dns_cache=True,
+            ttl_dns_cache=self.dns_ttl,
+            keepalive_timeout=self.keepalive_timeout,
+        )
@@ -1,4 +1,9 @@
+import contextlib
+import functools
+import importlib
+import os
 import re
+import tempfile
 
 page_regex = re.compile(r'^https?:\/\/(?:(?:www|v2)\.)?horsereality\.com')
 horse_page_regex = re.compile(r'^https?:\/\/(?:(?:www|v2)\.)?horsereality\.com\/horses\/(\d{1,10})')
@@ -18,3 +23,32 @@ def get_lifenumber_from_url(url: str) -> int:
         return None
 
     return int(lifenumber)
+
+
+@functools.lru_cache(maxsize=None)
+def import_optional(name: str):
+    """Import an optional dependency the first time it is needed, so that
+    importing horsereality stays fast. Returns ``None`` if it is not
+    installed."""
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        return None
+
+
+@contextlib.contextmanager
+def atomic_write(path: str, mode: str = 'w'):
+    """Open a temporary file beside ``path`` to write to, which replaces
+    ``path`` once the block exits, so that readers never see a partially
+    written file. The temporary file is removed if the block raises."""
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode, encoding=None if 'b' in mode else 'utf-8') as fp:
+            yield fp
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
@@ -13,5 +13,9 @@ setup(
     packages=['horsereality'],
     description='Simple client library for reading pages on Horse Reality.',
     install_requires=['aiohttp', 'beautifulsoup4'],
-    python_requires='>=3.6'
+    extras_require={
+        'render': ['numpy', 'Pillow'],
+        'parquet': ['pyarrow'],
+    },
+    python_requires='>=3.7'
 )